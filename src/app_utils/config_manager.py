@@ -1,5 +1,24 @@
+import atexit
 from configparser import ConfigParser
+from copy import deepcopy
 from datetime import datetime, timedelta
+from os import replace
+from threading import RLock, Timer
+
+
+class ConfigSection(dict):
+    """
+    A section of the configuration dictionary. Setting any of its fields schedules a save of the configuration
+    (see Configuration.write_ini)
+    """
+
+    def __init__(self, config, fields: dict):
+        super().__init__(fields)
+        self._config = config
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._config.write_ini()
 
 
 class Configuration:
@@ -13,9 +32,15 @@ class Configuration:
 
         This class  also handles config.ini file verification according to the SCHEMA and DEFAULT values.
 
+        Changes are saved automatically: setting a field schedules a save that will happen FLUSH_DELAY seconds later,
+        so that bursts of changes are written at once. Only fields that differ from what is in the file (dirty
+        fields) trigger an actual write, which is atomic. Pending changes are flushed on exit.
+
         config file / file = config.ini
     """
 
+    FLUSH_DELAY = 1 # Seconds
+
     # Defines the structure tha the config file should follow (values indicate type of the stored info)
     SCHEMA = {
         "MAIN": {
@@ -27,9 +52,21 @@ class Configuration:
             "show_terror": "bool",
             "version": ["2.1.0"],
             "on_launch" : ["nothing", "success_window", "logger"],
+            "fast_relaunch": "bool", # Skip the installation of versions that are already installed (see environment_cache)
+            "mod_cache_size": "int", # MB, mods shared by modpacks (see util/mod_cache.py)
+            "shallow_modpacks": "bool", # Clone / fetch only the latest commit of modpack repos
+            "modpack_sync": ["git", "archive"], # archive: sync modpacks without git (see modpack_snapshot)
+            "prefetch_modpacks": ["off", "selected", "installed"], # Download modpack updates while idle (modpack_prefetch)
+            "mirror_url": "str", # LAN mirror downloads are tried from first, ex: http://192.168.1.10:8585 (lan_mirror)
+            "mirror_serve": "bool", # Serve downloads to the launchers of the LAN (see util/mirror_server.py)
+            "mirror_port": "int",
+            "mirror_hosts": "str", # Extra hosts the mirror downloads from, comma separated ("*": any host)
             "cache_date_vanilla" : "datetime", # All dates are stored as str, but loaded as datetime.datetime
             "cache_date_forge": "datetime",
-            "cache_date_modpack": "datetime"
+            "cache_date_modpack": "datetime",
+            "cache_ttl_vanilla": "int", # Hours a cached version list is considered to be up-to-date
+            "cache_ttl_forge": "int",
+            "cache_ttl_modpack": "int"
         }
     }
 
@@ -41,12 +78,24 @@ class Configuration:
             "theme": "Dark",
             "language": "en",
             "show_side_menu": False,
-            "show_terror": 0,
+            "show_terror": False,
             "version": "2.1.0",
             "on_launch" : "logger",
+            "fast_relaunch": True,
+            "mod_cache_size": 4000,
+            "shallow_modpacks": True,
+            "modpack_sync": "git",
+            "prefetch_modpacks": "off",
+            "mirror_url": "",
+            "mirror_serve": False,
+            "mirror_port": 8585,
+            "mirror_hosts": "",
             "cache_date_vanilla": datetime.now() - timedelta(days=1), # Default time is yesterday (so that cache is forced to update)
             "cache_date_forge": datetime.now() - timedelta(days=1),
-            "cache_date_modpack": datetime.now() - timedelta(days=1)
+            "cache_date_modpack": datetime.now() - timedelta(days=1),
+            "cache_ttl_vanilla": 24,
+            "cache_ttl_forge": 24,
+            "cache_ttl_modpack": 1 # New modpacks should show up quickly
         }
     }
 
@@ -55,8 +104,14 @@ class Configuration:
         # other scripts it might change i.e. config_manager.py/main --> ../config.ini
         self.path = path
         self._cfg = {}
+        self._saved = {} # Configuration as it is in the file, {section : {field : str}}
+        self._lock = RLock()
+        self._flush_timer : Timer | None = None
         self.load_ini()
 
+        # Don't lose pending changes when the launcher is closed
+        atexit.register(self.flush)
+
 
     def load_ini(self):
         """
@@ -72,38 +127,86 @@ class Configuration:
             parser = ConfigParser()
             parser.read(self.path, encoding="UTF-8")
             self._cfg = {section: dict(parser.items(section)) for section in parser.sections()}
+            self._saved = deepcopy(self._cfg)
             self._validate_cfg()
 
         except IOError:
             # config.ini was not found, return default
             print("WARNING: config.ini was not found, returning default values and creating a new one")
-            self._cfg = self.DEFAULT
+            self._cfg = deepcopy(self.DEFAULT)
             self.write_ini()
 
         except (TypeError, KeyError):
             # config.ini is malformed
             print("WARNING: config.ini is malformed, returning default values")
-            self._cfg = self.DEFAULT
+            self._cfg = deepcopy(self.DEFAULT)
             self.write_ini()
 
         except UnicodeError:
             # config.ini could be obsolete
             print("WARNING: config.ini has wrong format, returning default values and overwriting")
-            self._cfg = self.DEFAULT
+            self._cfg = deepcopy(self.DEFAULT)
             self.write_ini()
 
+        # From now on, changes to any field will be saved
+        self._cfg = {section: ConfigSection(self, fields) for section, fields in self._cfg.items()}
+
 
     def write_ini(self):
         """
-        Creates and saves config.ini file with provided cfg dictionary
+        Schedules a save of the config.ini file, which will happen in FLUSH_DELAY seconds (see flush).
+        All changes made until then will be saved at once.
         """
-        print("Writing config.INI file")
+        with self._lock:
+            if self._flush_timer is None:
+                self._flush_timer = Timer(self.FLUSH_DELAY, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
 
-        save = ConfigParser()
-        save.read_dict(self._cfg)
+    def flush(self):
+        """
+        Saves the config.ini file right away, but only if some field has changed (dirty fields).
+        The file is written atomically (written to config.ini.tmp and then swapped)
+        """
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+
+            dirty_fields = self.get_dirty_fields()
+            if not dirty_fields:
+                return
+            print(f"Writing config.INI file, changed: {', '.join(dirty_fields)}")
+
+            current = self._serialize()
+            save = ConfigParser()
+            save.read_dict(current)
+
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as ini_file:
+                save.write(ini_file)
+            replace(tmp_path, self.path)
 
-        with open("config.ini", "w", encoding="utf-8") as ini_file:
-            save.write(ini_file)
+            self._saved = current
+
+    def get_dirty_fields(self) -> list:
+        """
+        Returns the fields whose value differs from the one saved in the file, as "section.field"
+        """
+        current = self._serialize()
+        dirty_fields = []
+        for section, fields in current.items():
+            for field, value in fields.items():
+                if self._saved.get(section, {}).get(field) != value:
+                    dirty_fields.append(f"{section}.{field}")
+        return dirty_fields
+
+    def _serialize(self) -> dict:
+        """
+        Returns the configuration as it would be written in the file (all values as str)
+        """
+        return {section: {field: str(value) for field, value in fields.items()}
+                for section, fields in self._cfg.items()}
 
     def _validate_cfg(self):
         """
@@ -214,7 +317,7 @@ class Configuration:
         """
         for section in self.DEFAULT.keys():
             if not section in self._cfg.keys():
-                self._cfg[section] = self.DEFAULT[section]
+                self._cfg[section] = deepcopy(self.DEFAULT[section])
                 changed = True
                 continue
 
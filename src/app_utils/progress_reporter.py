@@ -0,0 +1,183 @@
+from abc import ABC, abstractmethod
+from time import time
+from concurrent.futures import Future
+from queue import Queue, Empty
+from portablemc.standard import Environment, Version, Watcher, VersionLoadedEvent, JarFoundEvent, \
+    LibrariesResolvedEvent, DownloadStartEvent, DownloadProgressEvent, DownloadCompleteEvent
+from portablemc.forge import ForgePostProcessingEvent, ForgePostProcessedEvent
+from app_utils.launch_data_manager import LaunchData
+from util.downloader import download_files
+from util.utilities import is_git_installed
+
+
+class ProgressReporter(ABC):
+    """
+    Interface between the launch managers and whoever is launching the game, so that the launch managers don't
+    depend on the GUI. Launch managers receive the reporter as their "app" parameter.
+
+    App (main.py) implements it with its status bar and popups, while TextProgressReporter prints everything to the
+    console (see cli.py).
+
+    Every method must be implemented, instantiating a reporter that misses any of them fails right away.
+    Implementations must also provide these attributes:
+        cfg: Configuration
+        translations: Translations
+        version_cache: VersionCache
+    """
+
+    @abstractmethod
+    def update_status(self, code: str, message="undefined"):
+        """
+        Reports what the launcher is doing
+        code: idle, working, success, error
+        """
+
+    @abstractmethod
+    def wait_for_task(self, message: str, function, *args):
+        """
+        Runs function with the given positional arguments while the given message is displayed, returns its result
+        """
+
+    @abstractmethod
+    def install_version(self, launch_data: LaunchData, version: Version) -> Environment:
+        """
+        Installs the given portablemc version (vanilla or forge) and returns its Environment
+        """
+
+    @abstractmethod
+    def download(self, dest: str, stuff: dict, title: str) -> list:
+        """
+        Downloads stuff ({name of the file : download URL or list of URLs (mirrors)}) in dest
+        Returns a list containing all the files that failed to download
+        """
+
+    @abstractmethod
+    def wait_for_download(self, title: str, future: Future, progress: Queue) -> list:
+        """
+        Displays the progress of a download running in the background until it finishes, returns its result
+        progress: Queue where the download puts its progress: (downloaded files, total files, downloaded bytes, speed)
+        """
+
+    @abstractmethod
+    def ask_download_error(self, launch_data: LaunchData, failed_downloads: list) -> bool | None:
+        """
+        Some mods failed to download, what should be done?
+        Returns True: Continue the launch, False: Retry (only the failed ones), None: Abort
+        """
+
+    @abstractmethod
+    def ensure_git(self, launch_data: LaunchData) -> bool:
+        """
+        Returns True if git is installed (or has just been installed)
+        """
+
+    @abstractmethod
+    def run_game(self, launch_data: LaunchData, env: Environment):
+        """
+        Runs the game once its Environment is ready
+        """
+
+
+class TextProgressReporter(ProgressReporter):
+    """
+    ProgressReporter that prints everything to the console instead of using Tk widgets.
+    Meant to be used from scripts (cli.py), so it never asks anything: the answers are given on creation.
+    """
+
+    def __init__(self, cfg, translations, version_cache, continue_on_failed_downloads=False):
+        """
+        Args:
+            cfg: Configuration
+            translations: Translations
+            version_cache: VersionCache
+            continue_on_failed_downloads: Whether to launch a modpack anyway if some of its mods failed to download
+        """
+        self.cfg = cfg
+        self.translations = translations
+        self.version_cache = version_cache
+        self.continue_on_failed_downloads = continue_on_failed_downloads
+
+    def update_status(self, code: str, message="undefined"):
+        if code == "idle":
+            message = self.translations["status_idle"]
+        print(f"{code.upper()}: {message}")
+
+    def wait_for_task(self, message: str, function, *args):
+        print(f"{message}...")
+        return function(*args)
+
+    def install_version(self, launch_data: LaunchData, version: Version) -> Environment:
+        return version.install(watcher=TextInstallationWatcher())
+
+    def download(self, dest: str, stuff: dict, title: str) -> list:
+        print(f"{title} ({len(stuff)} files)")
+        return download_files(dest, stuff, ProgressPrinter())
+
+    def wait_for_download(self, title: str, future: Future, progress: Queue) -> list:
+        print(title)
+        print_progress = ProgressPrinter()
+        while not future.done() or not progress.empty():
+            try:
+                print_progress(*progress.get(timeout=0.5))
+            except Empty:
+                pass
+        return future.result()
+
+    def ask_download_error(self, launch_data: LaunchData, failed_downloads: list) -> bool | None:
+        print(f"ERROR: {len(failed_downloads)} files failed to download:")
+        for file in failed_downloads:
+            print(f" - {file}")
+        return True if self.continue_on_failed_downloads else None
+
+    def ensure_git(self, launch_data: LaunchData) -> bool:
+        # Git can't be installed without asking, the user will have to do it
+        return is_git_installed()
+
+    def run_game(self, launch_data: LaunchData, env: Environment):
+        env.run()
+
+
+class ProgressPrinter:
+    """
+    download_files on_progress that prints the progress once per downloaded file
+    """
+
+    def __init__(self):
+        self.last_count = -1
+
+    def __call__(self, count, total, size, speed):
+        if count != self.last_count:
+            self.last_count = count
+            print(f"[{count}/{total}] {size / 1000000:.2f}Mb {speed / 1000000:.2f}Mb/s")
+
+
+class TextInstallationWatcher(Watcher):
+    """
+    portablemc Watcher that prints the installation progress (same steps as VersionInstallationPopup)
+    """
+
+    def __init__(self):
+        self.last_print = 0.0
+        self.total_count = 0  # Files being downloaded
+
+    def handle(self, event) -> None:
+        if isinstance(event, VersionLoadedEvent):
+            print(f"Version {event.version} loaded")
+        elif isinstance(event, JarFoundEvent):
+            print("JVM loaded")
+        elif isinstance(event, ForgePostProcessingEvent):
+            print(f"Forge post processing: {event.task}")
+        elif isinstance(event, ForgePostProcessedEvent):
+            print("Forge installed")
+        elif isinstance(event, LibrariesResolvedEvent):
+            print("Libraries resolved")
+        elif isinstance(event, DownloadStartEvent):
+            self.total_count = event.entries_count
+            print(f"Downloading {event.entries_count} files")
+        elif isinstance(event, DownloadProgressEvent):
+            # Once per second is enough
+            if time() - self.last_print > 1:
+                self.last_print = time()
+                print(f"[{event.count}/{self.total_count}] {event.speed / 1000000:.2f}Mb/s")
+        elif isinstance(event, DownloadCompleteEvent):
+            print("Download complete")
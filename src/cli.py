@@ -0,0 +1,141 @@
+from argparse import ArgumentParser
+from app_utils.config_manager import Configuration
+from app_utils.launch_data_manager import LaunchData
+from app_utils.translation_manager import Translations
+from app_utils.progress_reporter import TextProgressReporter
+from launch_managers.generic import build_env
+from launch_managers.modpack_launcher import sync_modpack
+from launch_managers.environment_cache import repair_installation
+from util.get_versions import build_version_cache
+from util.utilities import check_if_path_is_valid
+from util.lan_mirror import configure_mirror
+from util.mirror_server import MirrorServer, MIRROR_DIR
+
+"""
+Headless entry point: installs, launches and syncs versions / modpacks from the command line, without Tk.
+It uses the same launch managers as the GUI, reporting progress to the console (TextProgressReporter).
+
+Launch parameters default to the ones saved by the GUI (launch_data.json), any argument given overrides them for this
+run only (nothing is saved).
+
+Usage examples (from the src directory):
+    python cli.py install --type Forge --version 1.20.1 --subversion recommended
+    python cli.py launch --type Vanilla --version 1.21 --username Steve
+    python cli.py sync --modpack SomeModpack --path D:/Games/.minecraft
+    python cli.py repair --path D:/Games/.minecraft
+    python cli.py serve --port 8585
+"""
+
+VERSION_TYPES = ["Vanilla", "Forge", "Modpack"]
+
+
+def build_parser() -> ArgumentParser:
+    parser = ArgumentParser(prog="cli.py", description="PyMinecraft launcher without GUI")
+    parser.add_argument("command", choices=["install", "launch", "sync", "repair", "serve"],
+                        help="install: install only, launch: install and run the game, sync: update a modpack, "
+                             "repair: check every installed file and remove the broken ones, "
+                             "serve: LAN mirror for other launchers (see util/mirror_server.py)")
+    parser.add_argument("--type", dest="version_type", choices=VERSION_TYPES, help="Version type")
+    parser.add_argument("--version", help="Minecraft version")
+    parser.add_argument("--subversion", help="Forge subversion (latest and recommended allowed)")
+    parser.add_argument("--modpack", help="Modpack name (implies --type Modpack)")
+    parser.add_argument("--path", help="Installation path (.minecraft folder)")
+    parser.add_argument("--username", help="Offline username")
+    parser.add_argument("--ram", type=int, help="RAM in MB")
+    parser.add_argument("--ignore-failed-mods", action="store_true",
+                        help="Launch modpacks even if some of their mods failed to download")
+    parser.add_argument("--port", type=int, help="LAN mirror port (serve)")
+    parser.add_argument("--mirror-dir", default=MIRROR_DIR, help="LAN mirror cache directory (serve)")
+    return parser
+
+
+def get_launch_data(args) -> LaunchData:
+    """
+    Saved launch data with the given arguments applied on top of it
+    """
+    launch_data = LaunchData()
+
+    if args.modpack is not None:
+        launch_data.modpack = args.modpack
+        launch_data.version_type = "Modpack"
+    for attribute in ("version_type", "version", "subversion", "path", "username", "ram"):
+        value = getattr(args, attribute)
+        if value is not None:
+            setattr(launch_data, attribute, value)
+
+    return launch_data
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+
+    cfg = Configuration()
+
+    if args.command == "serve":
+        return serve(cfg, args.port or cfg["MAIN"]["mirror_port"], args.mirror_dir)
+    configure_mirror(cfg)
+    translations = Translations(cfg["MAIN"]["language"])
+    reporter = TextProgressReporter(cfg, translations, build_version_cache(cfg),
+                                    continue_on_failed_downloads=args.ignore_failed_mods)
+
+    launch_data = get_launch_data(args)
+    if not check_if_path_is_valid(launch_data.path):
+        reporter.update_status("error", translations["status_error_invalid_path"])
+        return 1
+
+    # Repairs only need the installation path
+    if args.command == "repair":
+        reporter.update_status("working", translations["status_working_repairing"])
+        checked, broken = repair_installation(launch_data.path)
+        reporter.update_status("success", translations["status_success_repaired"].format(checked, broken))
+        return 0
+
+    if not launch_data.username:
+        reporter.update_status("error", translations["status_error_invalid_username"])
+        return 1
+
+    if args.command == "sync":
+        if not launch_data.modpack:
+            print("ERROR: No modpack selected (use --modpack)")
+            return 1
+        info = sync_modpack(launch_data, reporter)
+        if info is None:
+            return 1
+        reporter.update_status("success", f"{launch_data.modpack} (Forge {info['version']}-{info['subversion']})")
+        return 0
+
+    reporter.update_status("working", translations["status_working_launching"])
+    env = build_env(launch_data, reporter, launch_data.version_type)
+    if env is None:
+        # Error already reported by the launch manager
+        return 1
+
+    if args.command == "launch":
+        reporter.run_game(launch_data, env)
+
+    return 0
+
+
+def serve(cfg, port: int, directory: str) -> int:
+    """
+    Headless LAN mirror, serves until interrupted (Ctrl+C)
+    """
+    try:
+        server = MirrorServer(directory, port, cfg["MAIN"]["mirror_hosts"])
+    except OSError as error:
+        print(f"ERROR: LAN mirror couldn't be started on port {port}: {error}")
+        return 1
+
+    print(f"Serving the LAN mirror on port {port} ({directory}), launchers can use it with mirror_url = "
+          f"http://<this machine's address>:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,6 +1,9 @@
-from urllib.error import HTTPError
 import customtkinter as ctk
-from wget import download
+from concurrent.futures import Future
+from queue import Queue, Empty
+from util.downloader import download_files
+
+PROGRESS_POLL_INTERVAL = 100 # ms between checks of the progress of background downloads
 
 
 class ProgressBarWindow(ctk.CTkToplevel):
@@ -37,11 +40,11 @@ class ProgressBarWindow(ctk.CTkToplevel):
         self.progress_bar.update()
         self.update_progress(0, 0)
 
-    def update_progress(self, new_count, current_speed):
+    def update_progress(self, new_count, current_speed, downloaded_size=None):
         """
         Used to update the progress_bar using portablemc DownloadProgressEvent
 
-        Updates currently downloaded item count and speed
+        Updates currently downloaded item count and speed (and downloaded size in bytes, if given)
 
         ex: Installing a vanilla version
         """
@@ -49,54 +52,20 @@ class ProgressBarWindow(ctk.CTkToplevel):
         # Updated each progress event (not every time a download is completed, rather a tick)
         self.download_counter.configure(text=f"{new_count}/{self.total_count}")  # update current count
         self.download_counter.update()
-        self.download_speed.configure(text=f"{format(current_speed / 1000000, '.2f')}Mb/s")  # Update speed
+        speed_text = f"{format(current_speed / 1000000, '.2f')}Mb/s"
+        if downloaded_size is not None:
+            speed_text = f"{format(downloaded_size / 1000000, '.2f')} Mb ({speed_text})"
+        self.download_speed.configure(text=speed_text)  # Update speed
         self.download_speed.update()
 
         if new_count != self.current_count:
-            # Update only when an item dwonload has beeen completed
-            self.current_count += 1
+            # Update only when an item dwonload has beeen completed (several items may be completed at once)
+            self.current_count = new_count
             self.progress_bar.set(self.current_count / self.total_count)
             self.progress_bar.update()
 
         self.update()  # So that windows doesn't complain that the window stopped working
 
-    def update_from_wget(self, new_count, total, _width):
-        """
-        Similar to self.update_progress but adapted to wget.download's callback
-
-        For single file downloads only:
-        It uses self.current and self.total for the item's size and "dynamically" calculates the speed
-        (speed is Mb/tick, not Mb/s, though)
-
-        _width is passed by wget, but I won't use it
-
-        ex: Downloading git installer
-        """
-        self.download_counter.configure(text=f"{format(new_count/1000000, '.2f')}/{format(total/1000000, '.2f')} Mb")
-        # update both current and total
-        self.progress_bar.set(new_count / total)
-        self.download_speed.configure(text=f"{format(new_count/1000000 - self.current_count/1000000, '.2f')}Mb/tick")
-        self.current_count = new_count
-        self.download_speed.update()
-        self.download_counter.update()
-        self.progress_bar.update()
-        self.update()  # So that windows doesn't complain that the window stopped working
-
-    def update_speed_from_wget(self, new_count, total, _width):
-        """
-        Simpler version of self.update_from_wget that only updates the speed, but doesn't touch current or total
-
-        Use when downloading several  (more than 1) items with wget
-
-        In this case, since I don't have speed, I will use the speed counter as downloaded size counter
-
-        _width is passed by wget, but I won't use it
-
-        ex: when downloading mods for a modpack
-        """
-        self.download_speed.configure(text=f"{format(new_count/1000000, '.2f')} / {format(total/1000000, '.2f')} Mb")
-        self.update()
-
     def finish(self):
         self.grab_release()
         self.destroy()
@@ -108,10 +77,11 @@ def download_stuff(dest : str, stuff : dict, title: str):
     Will leave each downloaded file in dest/name_of_file
 
     Obviously, uses ProgressBarWindow to keep track of the download progress
+    Files are downloaded in parallel by util.downloader.download_files
 
     Args:
         dest: Destination folder (should NOT end in /)
-        stuff: dictionary where {name of the file : download URL}
+        stuff: dictionary where {name of the file : download URL or list of URLs (mirrors)}
         title: Title of the popup
 
     Returns:
@@ -122,19 +92,46 @@ def download_stuff(dest : str, stuff : dict, title: str):
     print(f"STUFF count: {len(stuff)}")
     progress_bar.set_total(len(stuff))
 
-    failed_downloads = []
+    failed_downloads = download_files(dest, stuff,
+                                      lambda count, _, size, speed: progress_bar.update_progress(count, speed, size))
+
+    progress_bar.finish()
+    return failed_downloads
 
-    count = 1
-    for file, url in stuff.items():
-        progress_bar.update_progress(count, 0)
-        # Attempt to download each file
-        try:
-            download(url, out=dest + f"/{file}", bar=progress_bar.update_speed_from_wget)
-        except HTTPError:
-            print("ERROR: File download failed! " + file)
-            failed_downloads.append(file)
 
-        count += 1
+def wait_for_download(title: str, future: Future, progress: Queue) -> list:
+    """
+    Displays the progress of a download running in the background (Tk can only be used from this thread) until it
+    finishes
 
-    progress_bar.finish()
-    return failed_downloads
\ No newline at end of file
+    Args:
+        title: Title of the popup
+        future: Download task, its result is returned
+        progress: Queue where the download puts its progress: (downloaded files, total files, downloaded bytes, speed)
+
+    Returns:
+        Result of the download task (usually, list containing all the files that failed to download)
+    """
+
+    progress_bar = ProgressBarWindow(title)
+
+    def poll():
+        # Only the latest progress is displayed
+        latest = None
+        while True:
+            try:
+                latest = progress.get_nowait()
+            except Empty:
+                break
+        if latest is not None:
+            count, progress_bar.total_count, size, speed = latest
+            progress_bar.update_progress(count, speed, size)
+
+        if future.done():
+            progress_bar.finish()
+        else:
+            progress_bar.after(PROGRESS_POLL_INTERVAL, poll)
+
+    progress_bar.after(PROGRESS_POLL_INTERVAL, poll)
+    progress_bar.wait_window()
+    return future.result()
@@ -0,0 +1,263 @@
+import hashlib
+import os
+from pathlib import Path
+from portablemc import LAUNCHER_VERSION
+from portablemc.auth import OfflineAuthSession
+from portablemc.download import DownloadEntry
+from portablemc.standard import Context, Version, Environment
+from app_utils.launch_data_manager import LaunchData
+from util.install_index import InstallIndex
+from util.lan_mirror import MirrorDownloadList
+from util.utilities import load_cache, save_cache, CorruptedFileError
+
+"""
+    Installing a version (portablemc.Version.install) loads the version json files, resolves libraries and checks
+    every library and asset before the game can run, even if the version was launched a minute ago.
+
+    Once a version has been installed, its resolved Environment (main class, JVM & game arguments, classpath...) is
+    saved in <path>/pyminecraft_envs, one file per version. The next time that version is launched from the same
+    installation path, the saved Environment is used directly as long as its validity stamp still matches.
+
+    Validity stamp: size and modification time of the files the Environment points to (version json files, game jar,
+    libraries, native libraries, JVM, assets index and logger config). Stating those files is much cheaper than
+    installing. If the stamp doesn't match, the files the version installed are checked against the installation
+    index (util/install_index.py), which only rehashes the files whose stat changed: if their content is still valid
+    the stamp is updated and the saved Environment used anyway, otherwise broken files are removed and the version is
+    installed again. Individual assets aren't part of the stamp (there are thousands of them), but they are indexed.
+"""
+
+ENV_CACHE_FORMAT = 1 # Bump when the saved data changes, so that old files are ignored
+ENV_CACHE_DIR = "pyminecraft_envs"
+
+
+def get_env_cache_file(context: Context, key: str) -> Path:
+    """
+    Where the Environment of the given version (key) is saved, inside the installation path (context main dir)
+    """
+    name = hashlib.sha1(f"{key}|{context.work_dir.absolute()}".encode()).hexdigest()[:16]
+    return context.versions_dir.parent / ENV_CACHE_DIR / f"{key.replace(':', '_')}-{name}.bin"
+
+
+def get_install_index(context: Context) -> InstallIndex:
+    """
+    Installation index of the installation path (context main dir)
+    """
+    return InstallIndex(str(context.versions_dir.parent / ENV_CACHE_DIR / "install_index.bin"))
+
+
+def compute_stamp(files: list) -> list:
+    """
+    Validity stamp of the given files: [[size, modification time in ns]], None for files that don't exist
+    """
+    stamp = []
+    for file in files:
+        try:
+            stat = os.stat(file)
+            stamp.append([stat.st_size, stat.st_mtime_ns])
+        except OSError:
+            stamp.append(None)
+    return stamp
+
+
+def _get_stamped_files(version: Version, env: Environment) -> list:
+    """
+    Files that the Environment depends on, used to compute its validity stamp
+    """
+    files = []
+
+    # Version json files of the whole hierarchy (forge version and its vanilla parent)
+    handle = version._hierarchy[0] if getattr(version, "_hierarchy", None) else None
+    while handle is not None:
+        files.append(str(handle.metadata_file().absolute()))
+        handle = handle.parent
+
+    # Classpath (libraries and game jar), native libraries and JVM
+    files.extend(env.args_replacements["classpath"].split(os.pathsep))
+    files.extend(str(Path(native_lib).absolute()) for native_lib in env.native_libs)
+    files.append(env.jvm_args[0])
+
+    # Assets index and logger config
+    files.append(str(env.context.assets_dir.absolute() / "indexes" / f"{env.args_replacements['assets_index_name']}.json"))
+    for arg in env.jvm_args:
+        if arg.startswith("-Dlog4j.configurationFile="):
+            files.append(arg.split("=", maxsplit=1)[1])
+
+    return files
+
+
+def save_env(key: str, version: Version, env: Environment) -> None:
+    """
+    Saves the Environment of a freshly installed version, along with its validity stamp
+    Must be called before the launcher changes the Environment (RAM, username...)
+    """
+    cache_file = get_env_cache_file(version.context, key)
+    files = _get_stamped_files(version, env)
+    data = {
+        "format": ENV_CACHE_FORMAT,
+        "portablemc": LAUNCHER_VERSION,
+        "files": files,
+        "stamp": compute_stamp(files),
+        "main_class": env.main_class,
+        "jvm_args": list(env.jvm_args),
+        "game_args": list(env.game_args),
+        "args_replacements": dict(env.args_replacements),
+        "native_libs": [str(native_lib) for native_lib in env.native_libs],
+        "fixes": dict(env.fixes)
+    }
+
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        save_cache(data, str(cache_file))
+    except (OSError, ValueError) as error:
+        # ValueError: marshal can't save some value, the version will be installed every time
+        print(f"WARNING: Couldn't save the environment of {key}: {error}")
+
+
+def load_env(key: str, context: Context, username: str) -> Environment | None:
+    """
+    Returns the saved Environment of the given version if its validity stamp still matches, None otherwise
+    Arguments that depend on the username are rebuilt, so that the user can change it without reinstalling
+    """
+    cache_file = get_env_cache_file(context, key)
+    try:
+        data = load_cache(str(cache_file))
+    except FileNotFoundError:
+        return None
+    except CorruptedFileError as error:
+        print(f"WARNING: Saved environment of {key} ignored: {error}")
+        return None
+
+    try:
+        if data["format"] != ENV_CACHE_FORMAT or data["portablemc"] != LAUNCHER_VERSION:
+            return None
+        stamp = compute_stamp(data["files"])
+        if stamp != data["stamp"]:
+            if not _check_changed_files(key, context, data["files"], stamp, data["stamp"]):
+                print(f"DEBUG: Installation of {key} changed, reinstalling")
+                return None
+            # Files were touched but their content is still valid, no need to check them again next time
+            data["stamp"] = stamp
+            try:
+                save_cache(data, str(cache_file))
+            except OSError as error:
+                print(f"WARNING: Couldn't update the stamp of {key}: {error}")
+
+        env = Environment(context, data["main_class"])
+        env.jvm_args = data["jvm_args"]
+        env.game_args = data["game_args"]
+        env.args_replacements = data["args_replacements"]
+        env.native_libs = [Path(native_lib) for native_lib in data["native_libs"]]
+        env.fixes = data["fixes"]
+    except (KeyError, TypeError) as error:
+        print(f"WARNING: Saved environment of {key} ignored: {error}")
+        return None
+
+    auth_session = OfflineAuthSession(username, None)
+    env.args_replacements["auth_player_name"] = auth_session.username
+    env.args_replacements["auth_uuid"] = auth_session.uuid
+    return env
+
+
+def _check_changed_files(key: str, context: Context, files: list, stamp: list, saved_stamp: list) -> bool:
+    """
+    Some of the files of the stamp changed, returns True if the content of all of them is still valid.
+    Only files in the installation index can be checked (version jsons, natives extracted by forge... aren't)
+    """
+    index = get_install_index(context)
+    if key not in index:
+        return False
+
+    indexed = set(index.get_paths(key))
+    for file, file_stamp, saved_file_stamp in zip(files, stamp, saved_stamp):
+        if file_stamp != saved_file_stamp and file not in indexed:
+            return False
+
+    broken = index.verify(key)
+    return broken is not None and not broken
+
+
+class RecordingDownloadList(MirrorDownloadList):
+    """
+    portablemc DownloadList that records every file added to it, even the ones that are already installed
+    (Files are downloaded from the LAN mirror first, see util/lan_mirror.py)
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.recorded = [] # [(path, expected sha1 or None)]
+
+    def add(self, entry: DownloadEntry, *, verify: bool = False) -> None:
+        self.recorded.append((str(entry.dst.absolute()), entry.sha1))
+        super().add(entry, verify=verify)
+
+
+def record_downloads(version: Version) -> list:
+    """
+    Makes the given version record every file it installs (or verifies) during its installation
+    Returns the list where they'll be recorded: [(path, expected sha1 or None)]
+    """
+    version._dl = RecordingDownloadList()
+    return version._dl.recorded
+
+
+def repair_installation(path: str) -> tuple:
+    """
+    "Repair installation" action: fully verifies (hashes) every file indexed in the given installation path (modpacks
+    included, they share its versions, libraries and assets). Broken files are removed and the versions that used them
+    will be installed again on their next launch.
+
+    Returns:
+        (number of files checked, number of broken files)
+    """
+    context = Context(Path(path), Path(path))
+    checked, broken_versions = get_install_index(context).repair()
+
+    broken = set()
+    for key, broken_files in broken_versions.items():
+        broken.update(broken_files)
+        invalidate_envs(key, context)
+    broken = len(broken)
+
+    print(f"Installation repaired: {checked} files checked, {broken} broken")
+    return checked, broken
+
+
+def invalidate_envs(key: str, context: Context) -> None:
+    """
+    Forgets the saved Environments of the given version, for every game directory (next launch will install it)
+    """
+    env_cache_dir = context.versions_dir.parent / ENV_CACHE_DIR
+    for cache_file in env_cache_dir.glob(f"{key.replace(':', '_')}-{'?' * 16}.bin"):
+        try:
+            os.remove(cache_file)
+        except FileNotFoundError:
+            pass
+
+
+def get_env(key: str, launch_data: LaunchData, version: Version, app, on_installed=None) -> Environment:
+    """
+    Fast relaunch: returns the saved Environment of the version if it is still valid, otherwise installs it (through
+    app.install_version) and saves the resulting Environment for the next launch.
+    Disabled with cfg["MAIN"]["fast_relaunch"] = False
+
+    Args:
+        key: Unique version id, ex: "vanilla-1.21", "forge-1.20.1-47.3.0"
+        launch_data:
+        version: portablemc version, ready to be installed
+        app: ProgressReporter
+        on_installed: Called after the version has been installed, on_installed(downloads), where downloads are all
+            the files portablemc downloaded (or verified): [(path, expected sha1 or None)]
+    """
+    if app.cfg["MAIN"]["fast_relaunch"]:
+        env = load_env(key, version.context, launch_data.username)
+        if env is not None:
+            print(f"Fast relaunch: {key} is already installed, skipping installation")
+            return env
+
+    downloads = record_downloads(version)
+    env = app.install_version(launch_data, version)
+    save_env(key, version, env)
+    get_install_index(version.context).record(key, downloads)
+    if on_installed is not None:
+        on_installed(downloads)
+    return env
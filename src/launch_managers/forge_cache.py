@@ -0,0 +1,158 @@
+import os
+import shutil
+from pathlib import Path
+from time import time_ns
+from portablemc.standard import Context
+from util.utilities import link_or_copy
+
+"""
+    The first time a Forge version is installed in an installation path, portablemc downloads its installer, extracts
+    some libraries from it and runs the installer processors (ForgePostProcessingEvent), which patch the vanilla jar.
+    That's the slow part of installing Forge. portablemc skips it whenever the Forge version json already exists in
+    versions/, so it is done once per installation path.
+
+    The result of that work (Forge version json and every library that was generated instead of downloaded) is saved
+    in the launcher's forge_cache directory, one directory per Forge version. Installing that Forge version in another
+    installation path links (or copies, if linking isn't possible) those files instead of running the installer again.
+    The rest of the files (vanilla version, regular libraries, assets) are installed by portablemc as usual.
+
+    forge_cache/<forge version id>/
+        versions/<forge version id>/<forge version id>.json
+        libraries/...
+"""
+
+FORGE_CACHE_DIR = "forge_cache"
+
+
+def get_forge_version_id(full_version_id: str) -> str:
+    """
+    portablemc version id of the given Forge version, ex: 1.20.1-47.3.0 -> forge-1.20.1-47.3.0
+    """
+    return f"forge-{full_version_id}"
+
+
+def is_forge_installed(version_id: str, context: Context) -> bool:
+    return (context.versions_dir / version_id / f"{version_id}.json").is_file()
+
+
+def restore_forge_install(version_id: str, context: Context, cache_dir: str = FORGE_CACHE_DIR) -> bool:
+    """
+    If the given Forge version isn't installed in the context but it is cached, links its post-processed files into
+    the context, so that portablemc doesn't run its installer again.
+
+    Returns True if the cached installation has been restored
+    """
+    cached_dir = os.path.join(cache_dir, version_id)
+    if is_forge_installed(version_id, context) or not os.path.isdir(cached_dir):
+        return False
+
+    main_dir = str(context.versions_dir.parent)
+    try:
+        for dir_path, _, files in os.walk(cached_dir):
+            for file in files:
+                relative_path = os.path.relpath(os.path.join(dir_path, file), cached_dir)
+                dst = os.path.join(main_dir, relative_path)
+                # The json is linked last: if something fails, the installer will run as usual
+                if not os.path.exists(dst) and not relative_path.startswith("versions"):
+                    link_or_copy(os.path.join(dir_path, file), dst)
+
+        json_path = os.path.join("versions", version_id, f"{version_id}.json")
+        link_or_copy(os.path.join(cached_dir, json_path), os.path.join(main_dir, json_path))
+    except OSError as error:
+        print(f"WARNING: Couldn't restore cached {version_id}, it will be installed from scratch: {error}")
+        return False
+
+    print(f"{version_id} restored from the Forge cache, skipping the Forge installer")
+    return True
+
+
+class ForgeInstallRecorder:
+    """
+    Records which files the Forge installer generates (post-processed jars, libraries extracted from the installer...)
+    while portablemc installs a Forge version, to save them in the Forge cache afterward.
+
+    Usage:
+        recorder = ForgeInstallRecorder(version_id, context)
+        (install the version)
+        recorder.save(downloads)
+    """
+
+    def __init__(self, version_id: str, context: Context, cache_dir: str = FORGE_CACHE_DIR):
+        self.version_id = version_id
+        self.context = context
+        self.cache_dir = cache_dir
+        # If the version is already installed, the installer won't run: nothing to record
+        self.enabled = not is_forge_installed(version_id, context)
+        self.start = time_ns()
+
+    def save(self, downloads: list) -> None:
+        """
+        Saves the generated files in the Forge cache
+        Args:
+            downloads: [(path, sha1)] files downloaded (or verified) by portablemc during the installation, those
+                will be downloaded again in other installation paths, so they aren't saved
+        """
+        cached_dir = os.path.join(self.cache_dir, self.version_id)
+        if not self.enabled or not is_forge_installed(self.version_id, self.context) or os.path.isdir(cached_dir):
+            return
+
+        downloaded = {os.path.normcase(path) for path, _ in downloads}
+        main_dir = self.context.versions_dir.parent.absolute()
+        generated = []
+        for dir_path, _, files in os.walk(self.context.libraries_dir.absolute()):
+            for file in files:
+                path = os.path.join(dir_path, file)
+                if os.path.normcase(path) in downloaded:
+                    continue
+                try:
+                    if os.stat(path).st_mtime_ns >= self.start:
+                        generated.append(os.path.relpath(path, main_dir))
+                except OSError:
+                    pass
+        generated.append(os.path.join("versions", self.version_id, f"{self.version_id}.json"))
+
+        # Save it in a temporary directory first, so that the cache never contains half of an installation
+        tmp_dir = cached_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        try:
+            for relative_path in generated:
+                link_or_copy(str(main_dir / relative_path), os.path.join(tmp_dir, relative_path))
+            os.replace(tmp_dir, cached_dir)
+        except OSError as error:
+            print(f"WARNING: Couldn't save {self.version_id} in the Forge cache: {error}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+
+        print(f"{self.version_id} saved in the Forge cache ({len(generated)} files)")
+
+
+def main():
+    """
+    Function only intended for testing and debugging purposes
+    Simulates a Forge installation in a path, caches it and restores it in another path
+    """
+    from tempfile import TemporaryDirectory
+
+    with TemporaryDirectory() as directory:
+        cache_dir = os.path.join(directory, FORGE_CACHE_DIR)
+        first = Context(Path(directory) / "first")
+        second = Context(Path(directory) / "second")
+        version_id = get_forge_version_id("1.20.1-47.3.0")
+
+        recorder = ForgeInstallRecorder(version_id, first, cache_dir)
+        downloaded = first.libraries_dir / "downloaded.jar"
+        generated = first.libraries_dir / "net" / "minecraftforge" / "forge-client.jar"
+        version_json = first.versions_dir / version_id / f"{version_id}.json"
+        for path in (downloaded, generated, version_json):
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(path.name)
+        recorder.save([(str(downloaded), None)])
+
+        print("Restored:", restore_forge_install(version_id, second, cache_dir))
+        for dir_path, _, files in os.walk(Path(directory) / "second"):
+            for file in files:
+                print(" -", os.path.relpath(os.path.join(dir_path, file), directory))
+
+
+if __name__ == "__main__":
+    main()
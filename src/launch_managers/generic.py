@@ -1,21 +1,20 @@
-from threading import Thread
 from app_utils.launch_data_manager import LaunchData
-from launch_managers.launch_with_logger_window import LaunchWithLoggerPopup
 from launch_managers.vanilla_launcher import build_vanilla_env
 from launch_managers.forge_launcher import build_forge_env
 from launch_managers.modpack_launcher import build_modpack_env
-from custom_toplevels.success_window import SuccessWindow
 from portablemc.standard import Environment
 
 
-def launch(launch_data : LaunchData, app, mode : str) -> None:
+def build_env(launch_data : LaunchData, app, mode : str) -> Environment | None:
     """
-    Entry point for launch_managers, handles everything regarding the launch.
-    Give the parameters,and it will call the corresponding functions / class to launch the game
+    Installs the given version (and modpack) and builds its portablemc env without running it
     Args:
         launch_data:
-        app:
+        app: ProgressReporter (App or TextProgressReporter)
         mode: "Vanilla", "Forge", "Modpack"
+
+    Returns:
+        portablemc Environment ready to be run, None if some kind of error happened
     """
 
     env : Environment | None = None # Shut up PyCharm linter!
@@ -26,18 +25,24 @@ def launch(launch_data : LaunchData, app, mode : str) -> None:
     elif mode == "Modpack":
         env = build_modpack_env(launch_data, app)
 
+    return env
+
+
+def launch(launch_data : LaunchData, app, mode : str) -> None:
+    """
+    Entry point for launch_managers, handles everything regarding the launch.
+    Give the parameters,and it will call the corresponding functions / class to launch the game
+    Args:
+        launch_data:
+        app: ProgressReporter (App or TextProgressReporter)
+        mode: "Vanilla", "Forge", "Modpack"
+    """
+
+    env = build_env(launch_data, app, mode)
+
     if env is None:
         # If some kind of error happened, env will be None, error will be displayed by specific method, do nothing
         return
 
-    if app.cfg["MAIN"]["on_launch"] == "nothing":
-        Thread(target=run, args=[env]).start()
-    elif app.cfg["MAIN"]["on_launch"] == "success_window":
-        Thread(target=run, args=[env]).start()
-        SuccessWindow(app)
-    elif app.cfg["MAIN"]["on_launch"] == "logger":
-        LaunchWithLoggerPopup(app, launch_data, env)
-
-# Auxiliary method for Thread run
-def run(env):
-    env.run()
\ No newline at end of file
+    # What happens once the game runs (success window, logger...) is up to whoever is launching the game
+    app.run_game(launch_data, env)
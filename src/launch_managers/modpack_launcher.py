@@ -1,33 +1,139 @@
 from app_utils.launch_data_manager import LaunchData
-from custom_toplevels.modpack_download_error_window import ModpackDownloadError
-from custom_toplevels.popup_wait import popup_wait_for_task
-from util.ensure_git import ensure_git
-from util.utilities import load_json
+from util.utilities import load_json, load_cache, save_cache, CorruptedFileError
+from util.get_versions import fetch_modpack_head
+from util.version_cache import NotModified
+from portablemc.http import HttpError
 from launch_managers.forge_launcher import build_forge_env
-from custom_toplevels.popup_download import download_stuff
+from launch_managers.environment_cache import ENV_CACHE_DIR
+from launch_managers.modpack_snapshot import update_snapshot, get_snapshot_commit, SnapshotError
+from launch_managers.modpack_prefetch import StagedMods, pause_prefetch, resume_prefetch
+from util.install_index import hash_file, get_stat
+from util.mod_index import ModIndex, parse_modlist, matches
+from util.mod_cache import ModCache, MOD_CACHE_DIR
+from util.downloader import download_files
 import os
+import shutil
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from queue import Queue
 from json.decoder import JSONDecodeError
 
+# portablemc directories that are shared by all modpacks (installed in the root of the minecraft installation)
+SHARED_STORE_DIRS = ("versions", "libraries", "assets", "jvm")
+# Mod index and mods being replaced, inside the modpack directory
+MOD_INDEX_DIR = "pyminecraft_mods"
+# Modpack repos are cloned and fetched with this depth (only the latest commit, history isn't needed to play)
+MODPACK_BRANCH = "master"
+MODPACK_DEPTH = 1
+# Seconds the remote head check may take, if GitHub doesn't answer in time the modpack is synced as usual
+REMOTE_HEAD_TIMEOUT = 5
+
 
 def build_modpack_env(launch_data : LaunchData, app):
     """
     Handles everything regarding modpack launch:
-        - Ensures git is installed
-        - Installs / Updates modpack
+        - Installs / Updates modpack (sync_modpack)
         - Creates forge env
     Builds portablemc Environment for modpacks Forge version
     Args:
         launch_data:
-        app:
+        app: ProgressReporter
 
     Returns:
         portablemc env to be run
     """
 
     print(f"Launching : {launch_data.modpack}")
+    start = perf_counter()
+
+    """
+        Launch parameters path always points to the root of the minecraft installation (kinda like the .minecraft
+        folder), while the game runs on the installed modpack's directory CalvonettaModpacks/... (mods, config, saves)
+        Versions, libraries and assets are installed in the root, so that they're shared by every modpack (and regular
+        Forge launches): install time and disk usage depend on the number of different Forge versions, not the number
+        of modpacks.
+    """
+    modpack_dir = launch_data.path + f"/CalvonettaModpacks/{launch_data.modpack}"
+    env = None
+
+    def install_forge(info):
+        nonlocal env
+        move_to_shared_store(modpack_dir, launch_data.path)
+        launch_data.version = info["version"]
+        launch_data.subversion = info["subversion"]
+        env = build_forge_env(launch_data, app, work_dir=modpack_dir)
+
+    # Pipelined launch: Forge is installed while the mods are synced
+    info = sync_modpack(launch_data, app, while_syncing_mods=install_forge)
+    if info is None:
+        # Error already reported by sync_modpack
+        return None
+
+    print(f"DEBUG: {launch_data.modpack} synced and installed in {perf_counter() - start:.2f}s")
+    return env
 
-    # Only continue if git is installed (Delegate that task on util.ensure_git)
-    if not ensure_git(app, launch_data):
+
+def move_to_shared_store(modpack_dir : str, root_dir : str) -> None:
+    """
+    Modpacks used to have their own versions, libraries and assets. Move them to the shared store (root of the
+    installation) so that they don't have to be downloaded again, files that already exist there are discarded.
+    Moving files within the same drive is instant.
+    """
+    for store_dir in SHARED_STORE_DIRS:
+        old_dir = os.path.join(modpack_dir, store_dir)
+        if not os.path.isdir(old_dir):
+            continue
+
+        print(f"Moving {old_dir} to the shared store")
+        for dir_path, _, files in os.walk(old_dir):
+            shared_path = os.path.join(root_dir, store_dir, os.path.relpath(dir_path, old_dir))
+            os.makedirs(shared_path, exist_ok=True)
+            for file in files:
+                if not os.path.exists(os.path.join(shared_path, file)):
+                    try:
+                        shutil.move(os.path.join(dir_path, file), os.path.join(shared_path, file))
+                    except OSError as error:
+                        print(f"WARNING: Couldn't move {file} to the shared store: {error}")
+
+        shutil.rmtree(old_dir, ignore_errors=True)
+        # Saved environments and installation index of the modpack pointed to the old files
+        shutil.rmtree(os.path.join(modpack_dir, ENV_CACHE_DIR), ignore_errors=True)
+
+
+def sync_modpack(launch_data : LaunchData, app, while_syncing_mods=None) -> dict | None:
+    """
+    Installs / Updates the modpack (repo and mods) without launching it:
+        - Ensures git is installed (git backend)
+        - Clones / Updates the modpack repo (or its snapshot, archive backend, cfg["MAIN"]["modpack_sync"])
+        - Removes deprecated mods and downloads the new ones
+    Args:
+        launch_data:
+        app: ProgressReporter
+        while_syncing_mods: while_syncing_mods(modpack info), called (from this thread) as soon as the repo is up to
+            date, while the mods are synced in the background. Used to install Forge at the same time (it only
+            depends on modpack_info.json). Not called if the sync fails before that.
+
+    Returns:
+        modpack_info.json contents (Forge version and subversion), None if the modpack couldn't be installed
+    """
+
+    # A background prefetch (see launch_managers/modpack_prefetch.py) writes to the same files, stop it first
+    if not pause_prefetch(blocking=False):
+        app.wait_for_task(app.translations["modpack_fetching"], pause_prefetch)
+    try:
+        return _sync_modpack(launch_data, app, while_syncing_mods)
+    finally:
+        resume_prefetch()
+
+
+def _sync_modpack(launch_data : LaunchData, app, while_syncing_mods) -> dict | None:
+    """
+    sync_modpack, must be called with the prefetch paused
+    """
+
+    # Only continue if git is installed (Delegate that task on the ProgressReporter), the archive backend doesn't use it
+    backend = app.cfg["MAIN"]["modpack_sync"]
+    if backend == "git" and not app.ensure_git(launch_data):
         app.update_status("error", app.translations["status_error_git_not_installed"])
         print("Aborting modpack launch, git not installed")
         return None
@@ -36,26 +142,43 @@ def build_modpack_env(launch_data : LaunchData, app):
     Explanation on what we'll do going forward:
         We will want to pull the repo and update the previous mods according to the new modlist. However, we don't want
         to touch mods installed by the user, so we must be careful with what we remove.
-        At the same time, we can't trust tha the mods in the modlist are actually installed, so we need to double
-        check with the actual mods folder.
+        At the same time, we can't trust tha the mods in the modlist are actually installed (or that they haven't been
+        corrupted or replaced), so we need to double check with the actual content of the mods folder.
         
         In order to achieve this, we'll follow the next order:
         1. Read the current modlist (what mods should currently be installed)
-        2. Read the current mods folder (what mods are currently installed)
-        3. Update the repo and read the new modlist (what mods will have to be currently installed)
-        4. Deduct which mods need to be removed and which ones installed
-        5. Remove and install said mods
+        2. Update the repo and read the new modlist (what mods will have to be currently installed)
+        3. Read the mods folder (what mods are currently installed and their sha1, see util/mod_index.py)
+        4. Deduct which mods need to be removed, which ones replaced and which ones installed
+        5. Remove and install said mods (reusing the content of the removed ones when possible)
     """
 
-    from git import Repo, InvalidGitRepositoryError, NoSuchPathError
     # path/CalvonettaModpacks/modpackName
     main_dir = launch_data.path + f"/CalvonettaModpacks/{launch_data.modpack}"
+    mods_dir = main_dir + "/mods"
+
+    # Fast path: the last sync was complete, nothing changed locally and the repo didn't change remotely
+    state = load_sync_state(main_dir)
+    if is_up_to_date(main_dir, launch_data.modpack, backend, state, app):
+        try:
+            info = load_json(main_dir + "/modpack_info.json")
+            print(f"{launch_data.modpack} is up-to-date, skipping sync")
+            if while_syncing_mods is not None:
+                while_syncing_mods(info)
+            return info
+        except (FileNotFoundError, JSONDecodeError):
+            pass
+    # Until this sync is complete, the fast path can't be taken
+    # (Nothing to invalidate on the first sync, and the modpack directory must not be created before the repo is cloned)
+    if state:
+        state["commit"] = None
+        save_sync_state(main_dir, state)
     repo_url = f"https://github.com/CalvonettaModpacks/{launch_data.modpack}.git"
     # Forge version and subversion will be fetched
 
     # 1. Read the current modlist
     try:
-        prev_modlist = load_json(main_dir + "/mods/modlist.json")
+        prev_modlist = load_json(mods_dir + "/modlist.json")
     except (FileNotFoundError, JSONDecodeError) as error:
         # If the modlist is not found, it probably means this is the first time we're launching this modpack, so,
         # it's normal. We'll download it when cloning the repo
@@ -65,73 +188,51 @@ def build_modpack_env(launch_data : LaunchData, app):
             print("WARNING: Modlist read failed. this could mean that the modlist was corrupted or has been wrongly modified.")
         prev_modlist = {} # In both cases, default to empty prev_modlist
 
-    # 2. Get the currently installed mods
-    try:
-        prev_mods = os.listdir(str(main_dir) + "/mods")
-    except FileNotFoundError:
-        # First launch, installation
-        prev_mods = []
-
-
-    # 3. Update the repo
+    # 2. Update the repo
     # this will ensure the repo exists and is up-to-date
     # (In this process, we might have updated the modlist)
-    try:
-        repo = Repo(main_dir)
-        origin = repo.remote()
-        popup_wait_for_task(app, app.translations["modpack_fetching"], origin.fetch)
-        repo.git.reset("--hard")
-        repo.git.merge("origin/master")
-    except (InvalidGitRepositoryError, NoSuchPathError):
-        # The repo doesn't exist (first launch), clone it
-        popup_wait_for_task(app, app.translations["modpack_cloning"], lambda : Repo.clone_from(repo_url, main_dir))
+    if backend == "archive":
+        try:
+            update_snapshot(main_dir, launch_data.modpack, MODPACK_BRANCH,
+                            get_remote_head(main_dir, launch_data.modpack, state, app), app,
+                            main_dir + f"/{MOD_INDEX_DIR}")
+        except SnapshotError as error:
+            print(f"ERROR: Modpack sync failed: {error}")
+            app.update_status("error", app.translations["status_error_modpack_sync"])
+            return None
+    else:
+        update_repo(main_dir, repo_url, app)
 
     """
     Each repo will contain (that are critical to PyMinecraft launcher)
-     - mods/modlist.json: dict where {mod_filename: URL}
+     - mods/modlist.json: dict where {mod_filename: URL or {"url": URL, "sha1": sha1, "size": size}}
      - modpack_info.json: Forge version and subversion
     """
     # Reload the info needed to install & launch the modpack
-    modlist = load_json(main_dir + "/mods/modlist.json")
+    modlist = parse_modlist(load_json(mods_dir + "/modlist.json"))
     info = load_json(main_dir + "/modpack_info.json")
-    version_id = info["version"]
-    subversion_id = info["subversion"]
 
-    # 4. Deduct which mods need to be removed and which installed
-    # Sets are a great tool to find differences between lists
-    prev_modlist = set(prev_modlist.keys())
-    prev_mods = set(prev_mods)
-    new_modlist = set(modlist.keys())
+    # 3, 4 and 5. Sync the mods
+    title = f"{app.translations['downloading_title']}: {launch_data.modpack}"
+    if while_syncing_mods is None:
+        failed_downloads = sync_mods(main_dir, prev_modlist, modlist, launch_data.path, app.cfg,
+                                     lambda dest, stuff: app.download(dest, stuff, title))
+    else:
+        # Mods are synced in the background (Tk can only be used from this thread), their progress is queued until
+        # it can be displayed
+        progress = Queue()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(sync_mods, main_dir, prev_modlist, modlist, launch_data.path, app.cfg,
+                                     lambda dest, stuff: download_files(dest, stuff, lambda *args: progress.put(args)))
+            while_syncing_mods(info)
+            failed_downloads = app.wait_for_download(title, future, progress)
 
-    # Remove: Mods that were both in the prev_modlist and installed but that are not in the new_modlist
-    mods_to_remove = (prev_modlist & prev_mods) - new_modlist
-    # Download: Mods that are not installed but are in the new modlist
-    mods_to_download = new_modlist - prev_mods
-
-    # Remove mods
-    for mod in mods_to_remove:
-        print(f"Removing deprecated {mod}")
-        os.remove(str(main_dir) + f"/mods/{mod}")
-
-    # Download mods
-    # (first get the URLS of the mods to download and build a proper dict for download_stuff)
-    download_dict = dict()
-    for mod in mods_to_download:
-        download_dict[mod] = modlist[mod]
-    failed_downloads = download_stuff(str(main_dir) + "/mods", download_dict, f"{app.translations['downloading_title']}: {launch_data.modpack}")
-
-    if failed_downloads:
-        error_popup = ModpackDownloadError(app, launch_data, failed_downloads)
-        error_popup.wait_window()  # Wait until the popup closes (choice made)
-        choice = error_popup.get_choice()
+    while failed_downloads:
+        choice = app.ask_download_error(launch_data, failed_downloads)
 
         # Continue
         if choice is True:
-            pass
-
-        # Retry
-        if choice is False:
-            return build_modpack_env(launch_data, app)
+            break
 
         # Abort
         if choice is None:
@@ -139,19 +240,321 @@ def build_modpack_env(launch_data : LaunchData, app):
             app.update_status("error", app.translations["modpack_error_abort"])
             return None
 
+        # Retry (only the failed mods, the repo and the rest of the mods are already up-to-date)
+        failed_downloads = retry_mods(main_dir, {mod: modlist[mod] for mod in failed_downloads}, launch_data.path,
+                                      app.cfg, lambda dest, stuff: app.download(dest, stuff, title))
+
+    else:
+        # Complete sync, the next one can take the fast path if nothing changes
+        state["commit"] = get_local_commit(main_dir, backend)
+        state["mods_stat"] = get_mods_stat(mods_dir)
+        save_sync_state(main_dir, state)
+
+    return info
+
+
+def sync_mods(main_dir : str, prev_modlist : dict, modlist : dict, root_dir : str, cfg, download) -> list:
     """
-        Launch parameters path should always point to the root of the minecraft installation (kinda like the .minecraft
-        folder)
-        At the same time, we want to launch forge on the installed modpack's directory CalvonettaModpacks/...
-        To do this, we inject the new path into the launch parameters, use it to build the env and then restore the
-        "root" path
+    Removes deprecated mods and installs the new ones (steps 3, 4 and 5 of sync_modpack)
+    Doesn't use the GUI, so it can run in the background
+    Args:
+        main_dir: Modpack directory
+        prev_modlist: Modlist before the repo was updated
+        modlist: Parsed new modlist
+        root_dir: Root of the minecraft installation (launch parameters path)
+        cfg: Configuration
+        download: download(dest, {file: URL}) -> failed downloads
+
+    Returns:
+        List of the mods that couldn't be installed
     """
-    root_path = launch_data.path
-    launch_data.path = main_dir
-    launch_data.version = version_id
-    launch_data.subversion = subversion_id
+    mods_dir = main_dir + "/mods"
 
-    env =  build_forge_env(launch_data, app)
-    # Restore the path before returning
-    launch_data.path = root_path
-    return env
+    # 3. Get the currently installed mods (only the ones that changed since the last sync are hashed)
+    index = ModIndex(mods_dir, main_dir + f"/{MOD_INDEX_DIR}/mod_index.bin")
+    installed = index.scan() # {mod_filename: (size, sha1)}
+
+    # 4. Deduct which mods need to be removed, replaced and downloaded
+    # Sets are a great tool to find differences between lists
+    prev_modlist = set(prev_modlist.keys())
+    new_modlist = set(modlist.keys())
+
+    # Remove: Mods that were both in the prev_modlist and installed but that are not in the new_modlist
+    mods_to_remove = (prev_modlist & installed.keys()) - new_modlist
+    # Replace: Mods that are installed but whose content doesn't match the one in the new modlist (corrupted,
+    # replaced by another jar, updated without changing the file name...)
+    mods_to_replace = {mod for mod in new_modlist & installed.keys() if not matches(modlist[mod], *installed[mod])}
+    # Install: Mods that are not installed (or are about to be replaced) but are in the new modlist
+    mods_to_install = (new_modlist - installed.keys()) | mods_to_replace
+
+    # 5. Remove mods
+    # Their content is kept aside (by sha1) until the new mods are installed, renamed mods don't have to be downloaded
+    stale_dir = main_dir + f"/{MOD_INDEX_DIR}/stale"
+    stale = dict() # {sha1: path}
+    for mod in mods_to_remove | mods_to_replace:
+        if mod in mods_to_remove:
+            print(f"Removing deprecated {mod}")
+        else:
+            print(f"WARNING: {mod} doesn't match the modlist, replacing it")
+        _, sha1 = installed.pop(mod)
+        index.remove(mod)
+        if sha1 is None or sha1 in stale:
+            os.remove(mods_dir + f"/{mod}")
+        else:
+            os.makedirs(stale_dir, exist_ok=True)
+            stale[sha1] = stale_dir + f"/{sha1}"
+            os.replace(mods_dir + f"/{mod}", stale[sha1])
+
+    # Install mods, reusing the ones whose content is already there (renamed or removed mods, duplicates, mods
+    # prefetched in the background, mods installed by other modpacks, see util/mod_cache.py)
+    # (the entries of the mods that have to be downloaded are gathered in mods_to_download)
+    cache = ModCache(root_dir + f"/{MOD_CACHE_DIR}", cfg["MAIN"]["mod_cache_size"] * 1000000)
+    staged = StagedMods(main_dir + f"/{MOD_INDEX_DIR}")
+    installed_hashes = {sha1: mod for mod, (_, sha1) in installed.items() if sha1 is not None}
+    mods_to_download = dict()
+    for mod in mods_to_install:
+        sha1 = modlist[mod]["sha1"]
+        if sha1 in stale:
+            print(f"Reusing the content of a removed mod for {mod}")
+            os.replace(stale.pop(sha1), mods_dir + f"/{mod}")
+        elif sha1 in installed_hashes:
+            print(f"Reusing {installed_hashes[sha1]} for {mod}")
+            shutil.copy2(mods_dir + f"/{installed_hashes[sha1]}", mods_dir + f"/{mod}")
+        elif (sha1 := staged.take(mod, modlist[mod], mods_dir + f"/{mod}")) is not None:
+            print(f"{mod} installed from the prefetched update")
+        else:
+            sha1 = cache.install(modlist[mod], mods_dir + f"/{mod}")
+            if sha1 is None:
+                mods_to_download[mod] = modlist[mod]
+                continue
+            print(f"{mod} installed from the mod cache")
+        index.add(mod, sha1)
+        installed_hashes[sha1] = mod
+    shutil.rmtree(stale_dir, ignore_errors=True)
+    # Whatever is left is not needed by this version of the modpack
+    staged.clear()
+
+    failed_downloads = download_mods(mods_dir, mods_to_download, index, cache, download)
+
+    # The rest of the mods of the modpack go to the mod cache too (already cached ones only get their last use updated)
+    for sha1, mod in installed_hashes.items():
+        if mod in modlist:
+            cache.add(mods_dir + f"/{mod}", sha1)
+    cache.evict()
+    cache.save()
+
+    return failed_downloads
+
+
+def retry_mods(main_dir : str, mods : dict, root_dir : str, cfg, download) -> list:
+    """
+    Installs again the given mods ({mod_filename: parsed modlist entry}) that failed to, without syncing the rest of
+    the modpack. The ones that have been manually installed meanwhile are only checked against the modlist.
+    Same arguments as sync_mods, returns the list of the mods that couldn't be installed
+    """
+    mods_dir = main_dir + "/mods"
+    index = ModIndex(mods_dir, main_dir + f"/{MOD_INDEX_DIR}/mod_index.bin")
+    cache = ModCache(root_dir + f"/{MOD_CACHE_DIR}", cfg["MAIN"]["mod_cache_size"] * 1000000)
+    # Whatever their URLs served before may be what is wrong with them
+    for entry in mods.values():
+        cache.forget(entry)
+
+    check_mods(mods_dir, {mod: entry for mod, entry in mods.items() if os.path.isfile(mods_dir + f"/{mod}")},
+               index, cache, downloaded=False)
+    missing = {mod: entry for mod, entry in mods.items() if not os.path.isfile(mods_dir + f"/{mod}")}
+    failed_downloads = download_mods(mods_dir, missing, index, cache, download) if missing else []
+
+    cache.save()
+    return failed_downloads
+
+
+def download_mods(mods_dir : str, mods : dict, index : ModIndex, cache : ModCache, download) -> list:
+    """
+    Downloads the given mods ({mod_filename: parsed modlist entry}, every mirror is tried) and checks them against the
+    modlist, mismatching ones are removed and handled as failed downloads
+    Returns the list of the mods that couldn't be installed
+    """
+    failed_downloads = download(mods_dir, {mod: entry["urls"] for mod, entry in mods.items()})
+    downloaded = {mod: entry for mod, entry in mods.items() if mod not in failed_downloads}
+    return failed_downloads + check_mods(mods_dir, downloaded, index, cache, downloaded=True)
+
+
+def check_mods(mods_dir : str, mods : dict, index : ModIndex, cache : ModCache, downloaded : bool) -> list:
+    """
+    Checks the given installed mods ({mod_filename: parsed modlist entry}) against the modlist. Matching ones are
+    recorded in the mod index and cache, the rest are removed.
+    Args:
+        downloaded: True if the mods have just been downloaded from the URLs of their entries
+
+    Returns:
+        List of the mods that were removed
+    """
+    names = list(mods.keys())
+    with ThreadPoolExecutor() as executor:
+        hashes = list(executor.map(hash_file, [mods_dir + f"/{mod}" for mod in names]))
+
+    removed = []
+    for mod, sha1 in zip(names, hashes):
+        stat = get_stat(mods_dir + f"/{mod}")
+        if stat is not None and matches(mods[mod], stat[0], sha1):
+            index.add(mod, sha1)
+            cache.add(mods_dir + f"/{mod}", sha1, mods[mod]["urls"] if downloaded else None)
+            continue
+        print(f"ERROR: {'Downloaded ' if downloaded else ''}{mod} doesn't match the modlist, removing it")
+        if stat is not None:
+            os.remove(mods_dir + f"/{mod}")
+        removed.append(mod)
+    index.save()
+    return removed
+
+
+def update_repo(main_dir : str, repo_url : str, app) -> None:
+    """
+    Clones the modpack repo or updates it to the latest commit of its branch
+    Local changes to tracked files are discarded, the launcher owns the checkout
+
+    Shallow (cfg["MAIN"]["shallow_modpacks"]): Only the latest commit of MODPACK_BRANCH is cloned / fetched, and the
+    checkout is moved straight to it. Repos with years of config churn don't drag their history along.
+    Otherwise: full history, fetch of every branch, hard reset and merge (how modpacks used to be synced)
+    """
+    from git import Repo, InvalidGitRepositoryError, NoSuchPathError
+
+    shallow = app.cfg["MAIN"]["shallow_modpacks"]
+    start = perf_counter()
+    try:
+        repo = Repo(main_dir)
+        action = "updated"
+    except NoSuchPathError:
+        # The repo doesn't exist (first launch), clone it
+        if shallow:
+            clone = lambda: Repo.clone_from(repo_url, main_dir, depth=MODPACK_DEPTH, single_branch=True,
+                                            branch=MODPACK_BRANCH)
+        else:
+            clone = lambda: Repo.clone_from(repo_url, main_dir)
+        app.wait_for_task(app.translations["modpack_cloning"], clone)
+        print(f"DEBUG: Modpack repo cloned in {perf_counter() - start:.2f}s ({'shallow' if shallow else 'full history'})")
+        return
+    except InvalidGitRepositoryError:
+        # The modpack was synced without git (archive backend), turn its directory into a repo
+        repo = Repo.init(main_dir)
+        repo.create_remote("origin", repo_url)
+        action = "initialized"
+
+    origin = repo.remote()
+    if shallow:
+        refspec = f"+refs/heads/{MODPACK_BRANCH}:refs/remotes/origin/{MODPACK_BRANCH}"
+        app.wait_for_task(app.translations["modpack_fetching"], lambda: origin.fetch(refspec, depth=MODPACK_DEPTH))
+        # The fetched commit's parents are cut off (shallow), so git can't tell that it descends from the local one
+        # and won't merge it: fast-forward by moving the checkout to it
+        repo.git.reset("--hard", f"origin/{MODPACK_BRANCH}")
+    else:
+        app.wait_for_task(app.translations["modpack_fetching"], origin.fetch)
+        if repo.head.is_valid():
+            repo.git.reset("--hard")
+            repo.git.merge(f"origin/{MODPACK_BRANCH}")
+        else:
+            repo.git.reset("--hard", f"origin/{MODPACK_BRANCH}")
+
+    print(f"DEBUG: Modpack repo {action} in {perf_counter() - start:.2f}s ({'shallow' if shallow else 'full history'})")
+
+
+def get_local_commit(main_dir : str, backend : str) -> str | None:
+    """
+    Commit the modpack directory is at (repo HEAD or applied snapshot), None if unknown
+    """
+    if backend == "archive":
+        return get_snapshot_commit(main_dir + f"/{MOD_INDEX_DIR}")
+
+    from git import Repo, InvalidGitRepositoryError, NoSuchPathError
+    try:
+        return Repo(main_dir).head.commit.hexsha
+    except (InvalidGitRepositoryError, NoSuchPathError, ValueError):
+        return None
+
+
+def load_sync_state(main_dir : str) -> dict:
+    """
+    Sync state of the modpack:
+        commit: Commit the last complete sync left the repo at (None if the last sync wasn't complete)
+        mods_stat: {mod_filename : [size, modification time]} of the mods folder after that sync
+        remote_commit: Head of the modpack branch the last time it was checked, and validators of that response
+    """
+    try:
+        return load_cache(main_dir + f"/{MOD_INDEX_DIR}/sync_state.bin")
+    except FileNotFoundError:
+        return {}
+    except CorruptedFileError as error:
+        print(f"WARNING: Modpack sync state ignored: {error}")
+        return {}
+
+
+def save_sync_state(main_dir : str, state : dict) -> None:
+    try:
+        os.makedirs(main_dir + f"/{MOD_INDEX_DIR}", exist_ok=True)
+        save_cache(state, main_dir + f"/{MOD_INDEX_DIR}/sync_state.bin")
+    except OSError as error:
+        print(f"WARNING: Couldn't save modpack sync state: {error}")
+
+
+def is_up_to_date(main_dir : str, modpack : str, backend : str, state : dict, app = None) -> bool:
+    """
+    True if the modpack doesn't need to be synced: its last sync was complete, the local repo and mods folder haven't
+    changed since then and the head of the remote branch is still the synced commit.
+
+    Mods are compared by stat, like InstallIndex.verify does: added, removed, replaced or truncated jars are detected,
+    but a jar corrupted without changing its size or modification time isn't.
+
+    Any error means that the modpack has to be synced as usual.
+    """
+    if state.get("commit") is None or state.get("mods_stat") != get_mods_stat(main_dir + "/mods"):
+        return False
+    if get_local_commit(main_dir, backend) != state["commit"]:
+        return False
+
+    return get_remote_head(main_dir, modpack, state, app) == state["commit"]
+
+
+def get_mods_stat(mods_dir : str) -> dict:
+    """
+    {mod_filename : [size, modification time]} of every file of the given mods folder (stat of the folder itself only
+    changes when files are added, removed or renamed)
+    """
+    mods_stat = {}
+    try:
+        for entry in os.scandir(mods_dir):
+            if entry.is_file():
+                stat = entry.stat()
+                mods_stat[entry.name] = [stat.st_size, stat.st_mtime_ns]
+    except OSError:
+        pass
+    return mods_stat
+
+
+def get_remote_head(main_dir : str, modpack : str, state : dict, app = None) -> str | None:
+    """
+    Latest commit of the modpack branch, None if it couldn't be checked (in REMOTE_HEAD_TIMEOUT seconds)
+    Only requested to GitHub's API conditionally, if it didn't change GitHub answers with a 304 (which doesn't use API
+    quota) and the one saved in the sync state is used
+    """
+    # The request can't be given a timeout, it is abandoned if it takes too long
+    executor = ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(fetch_modpack_head, modpack, MODPACK_BRANCH, state.get("remote_validators", {}))
+    executor.shutdown(wait=False)
+    try:
+        if app is None:
+            state["remote_commit"], state["remote_validators"] = future.result(REMOTE_HEAD_TIMEOUT)
+        else:
+            state["remote_commit"], state["remote_validators"] = app.wait_for_task(
+                app.translations["modpack_checking"], future.result, REMOTE_HEAD_TIMEOUT)
+        if os.path.isdir(main_dir):
+            # Otherwise it is saved once the modpack has been installed
+            save_sync_state(main_dir, state)
+    except NotModified:
+        pass
+    except FutureTimeoutError:
+        print(f"WARNING: Couldn't check the latest commit of {modpack}: no answer in {REMOTE_HEAD_TIMEOUT}s")
+        return None
+    except (HttpError, ValueError, KeyError, TypeError) as error:
+        print(f"WARNING: Couldn't check the latest commit of {modpack}: {error}")
+        return None
+    return state.get("remote_commit")
@@ -0,0 +1,203 @@
+import os
+import shutil
+from threading import Lock, Event
+from portablemc.http import HttpError
+from util.lan_mirror import http_request
+from util.downloader import download_files, DOWNLOAD_WORKERS
+from util.get_versions import GITHUB_RAW_URL, MODPACKS_GITHUB_USER
+from util.install_index import hash_file, get_stat
+from util.mod_index import ModIndex, parse_modlist, matches
+from util.mod_cache import ModCache, MOD_CACHE_DIR
+from util.utilities import load_cache, save_cache, CorruptedFileError
+
+"""
+    Opt-in background prefetch of modpack updates (cfg["MAIN"]["prefetch_modpacks"]: "off", "selected" or
+    "installed"). While the launcher is idle, installed modpacks are checked for updates (same cheap remote head check
+    as the sync fast path). If there's a new commit, its modlist is read from raw.githubusercontent.com, and the mods
+    that the update will need (and that aren't installed or in the mod cache already) are downloaded to the staging
+    directory of the modpack. The git objects of the new commit are fetched too (git backend), without touching the
+    checkout.
+
+    Nothing in the modpack changes until it is launched: sync_mods moves the staged mods into the mods folder (an
+    atomic rename per mod, same drive) instead of downloading them, and clears the staging directory.
+
+    Only one prefetch runs at a time, and syncs pause it (pause_prefetch) since both write to the same files. A paused
+    prefetch stops after the batch of mods it is downloading, its partial downloads are resumed by the next prefetch.
+"""
+
+PREFETCH_DELAY = 60 * 1000 # ms, first check after the launcher is opened
+PREFETCH_INTERVAL = 15 * 60 * 1000 # ms, between checks
+
+_lock = Lock() # Held while prefetching or syncing
+_stop = Event()
+
+
+def pause_prefetch(blocking: bool = True) -> bool:
+    """
+    Stops the prefetch in progress (waits for it to finish its current batch) and prevents new ones from starting
+    until resume_prefetch is called. Returns False if it couldn't be paused without blocking.
+    """
+    _stop.set()
+    if not _lock.acquire(blocking=blocking):
+        return False
+    _stop.clear()
+    return True
+
+
+def resume_prefetch() -> None:
+    _lock.release()
+
+
+def get_installed_modpacks(root_dir: str) -> list:
+    try:
+        return [entry.name for entry in os.scandir(root_dir + "/CalvonettaModpacks") if entry.is_dir()]
+    except FileNotFoundError:
+        return []
+
+
+class StagedMods:
+    """
+    Mods of a modpack update downloaded in the background, waiting for the next sync
+    Manifest file content: {mod_filename : [size, modification time, sha1, [URLs]]}
+    """
+
+    def __init__(self, state_dir: str):
+        """
+        Args:
+            state_dir: Directory where the modpack keeps its mod index (the staging directory is created inside)
+        """
+        self.directory = state_dir + "/staged"
+        self._manifest = {}
+        try:
+            self._manifest = load_cache(self.directory + "/staged.bin")
+        except FileNotFoundError:
+            pass
+        except CorruptedFileError as error:
+            print(f"WARNING: Staged mods ignored: {error}")
+
+    def has(self, mod: str, entry: dict) -> bool:
+        """
+        True if the given mod is staged and it matches the given (parsed) modlist entry
+        """
+        record = self._manifest.get(mod)
+        return record is not None and record[3] == entry["urls"] and matches(entry, record[0], record[2])
+
+    def add(self, mod: str, entry: dict) -> bool:
+        """
+        Records a mod that has just been downloaded to the staging directory, if it matches its modlist entry
+        """
+        path = self.directory + f"/{mod}"
+        sha1 = hash_file(path)
+        stat = get_stat(path)
+        if stat is None or not matches(entry, stat[0], sha1):
+            print(f"WARNING: Prefetched {mod} doesn't match the modlist, discarding it")
+            if stat is not None:
+                os.remove(path)
+            return False
+        self._manifest[mod] = [stat[0], stat[1], sha1, entry["urls"]]
+        return True
+
+    def take(self, mod: str, entry: dict, dst: str) -> str | None:
+        """
+        Moves the given staged mod to dst if it matches the given (parsed) modlist entry
+        Returns its sha1, None if it isn't staged
+        """
+        if not self.has(mod, entry):
+            return None
+        size, mtime, sha1, _ = self._manifest.pop(mod)
+        path = self.directory + f"/{mod}"
+        if get_stat(path) != (size, mtime):
+            return None
+        try:
+            os.replace(path, dst)
+        except OSError as error:
+            print(f"WARNING: Couldn't install prefetched {mod}: {error}")
+            return None
+        return sha1
+
+    def save(self) -> None:
+        try:
+            save_cache(self._manifest, self.directory + "/staged.bin")
+        except OSError as error:
+            print(f"WARNING: Couldn't save staged mods: {error}")
+
+    def clear(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self._manifest = {}
+
+
+def prefetch_modpacks(root_dir: str, modpacks: list, cfg) -> None:
+    """
+    Prefetches the updates of the given modpacks (meant to be run in a background thread)
+    Does nothing if a prefetch or a sync is already running
+    """
+    if not _lock.acquire(blocking=False):
+        return
+    try:
+        for modpack in modpacks:
+            if _stop.is_set():
+                break
+            try:
+                prefetch_modpack(root_dir, modpack, cfg)
+            except Exception as error:
+                # Never let a background task crash, the update will be synced at launch anyway
+                print(f"WARNING: Prefetch of {modpack} failed: {error}")
+    finally:
+        _lock.release()
+
+
+def prefetch_modpack(root_dir: str, modpack: str, cfg) -> None:
+    """
+    If the given (installed) modpack has an update, stages the mods it needs
+    Must be called while holding the prefetch lock
+    """
+    from launch_managers.modpack_launcher import (load_sync_state, get_remote_head, get_local_commit, MOD_INDEX_DIR,
+                                                  MODPACK_BRANCH, MODPACK_DEPTH)
+
+    main_dir = root_dir + f"/CalvonettaModpacks/{modpack}"
+    if not os.path.isdir(main_dir):
+        return
+
+    backend = cfg["MAIN"]["modpack_sync"]
+    remote_commit = get_remote_head(main_dir, modpack, load_sync_state(main_dir))
+    if remote_commit is None or remote_commit == get_local_commit(main_dir, backend):
+        return
+
+    print(f"Prefetching {modpack} update ({remote_commit[:7]})")
+    try:
+        modlist_url = f"{GITHUB_RAW_URL}/{MODPACKS_GITHUB_USER}/{modpack}/{remote_commit}/mods/modlist.json"
+        modlist = parse_modlist(http_request("GET", modlist_url, accept="application/json").json())
+    except (HttpError, ValueError, KeyError, TypeError) as error:
+        print(f"WARNING: Couldn't read the modlist of the {modpack} update: {error}")
+        return
+
+    if backend == "git":
+        try:
+            from git import Repo
+            refspec = f"+refs/heads/{MODPACK_BRANCH}:refs/remotes/origin/{MODPACK_BRANCH}"
+            Repo(main_dir).remote().fetch(refspec, depth=MODPACK_DEPTH if cfg["MAIN"]["shallow_modpacks"] else None)
+        except Exception as error:
+            print(f"WARNING: Couldn't fetch the {modpack} update: {error}")
+
+    # Mods the update needs that can't be installed locally
+    state_dir = main_dir + f"/{MOD_INDEX_DIR}"
+    installed = ModIndex(main_dir + "/mods", state_dir + "/mod_index.bin").scan()
+    installed_hashes = {sha1 for _, sha1 in installed.values() if sha1 is not None}
+    cache = ModCache(root_dir + f"/{MOD_CACHE_DIR}", cfg["MAIN"]["mod_cache_size"] * 1000000)
+    staged = StagedMods(state_dir)
+    to_stage = [mod for mod, entry in modlist.items()
+                if not (mod in installed and matches(entry, *installed[mod]))
+                and entry["sha1"] not in installed_hashes and entry not in cache and not staged.has(mod, entry)]
+
+    for i in range(0, len(to_stage), DOWNLOAD_WORKERS):
+        if _stop.is_set():
+            print(f"Prefetch of {modpack} paused")
+            break
+        batch = to_stage[i:i + DOWNLOAD_WORKERS]
+        failed_downloads = download_files(staged.directory, {mod: modlist[mod]["urls"] for mod in batch})
+        for mod in batch:
+            if mod not in failed_downloads:
+                staged.add(mod, modlist[mod])
+        staged.save()
+    else:
+        print(f"{modpack} update prefetched ({len(to_stage)} mods staged)")
@@ -0,0 +1,152 @@
+import os
+import zipfile
+from util.downloader import download_files
+from util.get_versions import GITHUB_CODELOAD_URL, MODPACKS_GITHUB_USER
+from util.install_index import get_stat
+from util.utilities import load_cache, save_cache, CorruptedFileError
+
+"""
+    Git-free modpack sync backend (cfg["MAIN"]["modpack_sync"] = "archive"): instead of cloning the modpack repo, the
+    snapshot of its latest commit is downloaded as a zip archive (codeload.github.com, doesn't use API quota) and
+    extracted into the modpack directory. No git installation is needed and no git process is run.
+
+    The snapshot manifest keeps, for every file extracted from the archive, its size and CRC32 in the archive (both
+    are stored in the zip directory, reading them doesn't extract anything) and its modification time once extracted.
+    Only files that changed in the archive, or that were modified locally, are written. Files that are no longer in
+    the archive are removed. Any other file (mods, saves, options...) is left untouched, like git does with untracked
+    files.
+
+    The archive is pinned to the latest commit of the modpack branch (when it could be checked) and the commit it
+    contains is read from the zip comment (git archive writes it there), which is also how the snapshot is validated:
+    if it is already applied, nothing is downloaded.
+
+    Manifest file content:
+        commit: Commit of the applied snapshot
+        files: {relative path : [size, CRC32, modification time once extracted]}
+"""
+
+
+class SnapshotError(Exception):
+    """
+    Raised when the snapshot of a modpack can't be downloaded or applied
+    """
+    pass
+
+
+def _load_manifest(state_dir: str) -> dict:
+    try:
+        return load_cache(state_dir + "/snapshot.bin")
+    except FileNotFoundError:
+        return {"commit": None, "files": {}}
+    except CorruptedFileError as error:
+        print(f"WARNING: Snapshot manifest ignored: {error}")
+        return {"commit": None, "files": {}}
+
+
+def get_snapshot_commit(state_dir: str) -> str | None:
+    """
+    Commit of the snapshot applied in the modpack directory, None if there isn't any
+    """
+    return _load_manifest(state_dir)["commit"]
+
+
+def _is_intact(main_dir: str, files: dict) -> bool:
+    """
+    True if none of the extracted files has been modified or removed
+    """
+    for relative_path, (size, _, mtime) in files.items():
+        if get_stat(os.path.join(main_dir, relative_path)) != (size, mtime):
+            return False
+    return True
+
+
+def update_snapshot(main_dir: str, modpack: str, branch: str, commit: str | None, app, state_dir: str) -> None:
+    """
+    Brings the modpack directory to the snapshot of the given commit of the modpack repo
+    Args:
+        main_dir: Modpack directory
+        modpack: Modpack (repo) name
+        branch: Branch whose latest snapshot is downloaded if commit is unknown (None)
+        commit: Latest commit of the branch
+        app: ProgressReporter
+        state_dir: Directory where the manifest and the archive are saved
+
+    Raises:
+        SnapshotError
+    """
+    manifest = _load_manifest(state_dir)
+    if commit is not None and commit == manifest["commit"] and _is_intact(main_dir, manifest["files"]):
+        print(f"DEBUG: Snapshot {commit[:7]} already applied")
+        return
+
+    ref = commit if commit is not None else f"refs/heads/{branch}"
+    url = f"{GITHUB_CODELOAD_URL}/{MODPACKS_GITHUB_USER}/{modpack}/zip/{ref}"
+    message = app.translations["modpack_fetching" if manifest["commit"] is not None else "modpack_cloning"]
+    if app.wait_for_task(message, download_files, state_dir, {"snapshot.zip": url}):
+        raise SnapshotError(f"Couldn't download {url}")
+
+    archive_path = state_dir + "/snapshot.zip"
+    try:
+        with zipfile.ZipFile(archive_path) as archive:
+            archive_commit = archive.comment.decode("ascii", errors="ignore").strip() or commit
+            if commit is not None and archive_commit != commit:
+                raise SnapshotError(f"Expected snapshot of {commit}, got {archive_commit}")
+            files, written, removed = _apply(archive, main_dir, manifest["files"])
+    except (zipfile.BadZipFile, OSError) as error:
+        # BadZipFile is also raised if the CRC of an extracted file doesn't match
+        raise SnapshotError(f"Couldn't apply the snapshot of {modpack}: {error}")
+    finally:
+        try:
+            os.remove(archive_path)
+        except FileNotFoundError:
+            pass
+
+    try:
+        save_cache({"commit": archive_commit, "files": files}, state_dir + "/snapshot.bin")
+    except OSError as error:
+        print(f"WARNING: Couldn't save the snapshot manifest: {error}")
+    print(f"DEBUG: Snapshot {archive_commit[:7]} applied ({written} files written, {removed} removed)")
+
+
+def _apply(archive: zipfile.ZipFile, main_dir: str, files: dict) -> tuple:
+    """
+    Extracts the files of the archive that changed and removes the ones that are not in it anymore
+    Returns:
+        (new manifest files, number of files written, number of files removed)
+    """
+    root = os.path.abspath(main_dir)
+    new_files = dict()
+    written = 0
+    for info in archive.infolist():
+        # Every file of the archive is inside a <repo>-<commit> directory
+        if info.is_dir() or "/" not in info.filename:
+            continue
+        relative_path = info.filename.split("/", maxsplit=1)[1]
+        path = os.path.abspath(os.path.join(root, relative_path))
+        if os.path.commonpath([root, path]) != root:
+            print(f"WARNING: Snapshot file outside of the modpack directory ignored: {info.filename}")
+            continue
+
+        record = files.get(relative_path)
+        if (record is not None and record[:2] == [info.file_size, info.CRC]
+                and get_stat(path) == (info.file_size, record[2])):
+            new_files[relative_path] = record
+            continue
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with archive.open(info) as src, open(path + ".tmp", "wb") as dst:
+            while chunk := src.read(1024 * 1024):
+                dst.write(chunk)
+        os.replace(path + ".tmp", path)
+        new_files[relative_path] = [info.file_size, info.CRC, get_stat(path)[1]]
+        written += 1
+
+    removed = 0
+    for relative_path in files.keys() - new_files.keys():
+        try:
+            os.remove(os.path.join(root, relative_path))
+            removed += 1
+        except FileNotFoundError:
+            pass
+
+    return new_files, written, removed
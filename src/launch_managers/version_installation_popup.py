@@ -1,7 +1,10 @@
 from concurrent.futures.thread import ThreadPoolExecutor
 import customtkinter as ctk
 from queue import Queue
-from portablemc.standard import Environment, Version, Watcher
+from portablemc.forge import ForgePostProcessedEvent
+from portablemc.standard import Environment, Version, Watcher, VersionLoadedEvent, JarFoundEvent, \
+    LibrariesResolvedEvent, DownloadCompleteEvent, DownloadStartEvent, DownloadProgressEvent
+from app_utils.launch_data_manager import LaunchData
 from custom_toplevels.popup_download import ProgressBarWindow
 
 """
@@ -88,4 +91,143 @@ class InstallationWatcher(Watcher):
         self.queue = queue
 
     def handle(self, event) -> None:
-        self.queue.put(event)
\ No newline at end of file
+        self.queue.put(event)
+
+
+class VanillaInstallationPopup(VersionInstallationPopup):
+
+    def __init__(self, app, launch_data : LaunchData, version : Version):
+        self.version_name = f"Vanilla {launch_data.version}"
+
+        #task_list = ("Load version", "Load JVM (Java)", "Resolve libraries", "Download vanilla version")
+        #task_types = [VersionLoadedEvent, JarFoundEvent, LibrariesResolvedEvent, DownloadCompleteEvent]
+        task_list = tuple(app.translations["vanilla_tasks"]) # Translated task list
+
+        super().__init__(app, self.version_name, task_list, version)
+
+    def handle_event(self):
+
+        while not self.queue.empty():
+            event = self.queue.get()
+
+            # Task 1 (Vanilla Version loaded)
+            if isinstance(event, VersionLoadedEvent):
+                print("TASK 1 (Load Vanilla version) DONE")
+                self.tasks[0].select()
+
+            # Task 2 (Load JVM)
+            elif isinstance(event, JarFoundEvent):
+                print("TASK 2 (load JVM) DONE")
+                self.tasks[1].select()
+
+            # Task 3 (Library resolution)
+            elif isinstance(event, LibrariesResolvedEvent):
+                print("TASK 3 (Libraries resolved) DONE")
+                self.tasks[2].select()
+
+            # Task 4 (download Vanilla version)
+            elif isinstance(event, DownloadStartEvent):
+                print("Task 4 (Download Vanilla version) START")
+                self.window = ProgressBarWindow(f"Downloading {self.version_name}")
+                self.window.set_total(event.entries_count)
+            elif isinstance(event, DownloadProgressEvent): # Update download
+                self.window.update_progress(event.count, event.speed)
+            elif isinstance(event, DownloadCompleteEvent):
+                print("Task 4 (Download Vanilla version) DONE")
+                self.tasks[3].select()
+                self.window.finish() # Close progress bar window
+                self.destroy() # End
+                return
+
+        # Just in case some step was skipped. if we are done, end the window
+        if self.future.done():
+            self.destroy()
+            return
+
+        self.update()
+        self.after(100, self.handle_event)
+
+    def get_env(self) -> Environment:
+        return self.future.result()
+
+
+class ForgeInstallationPopup(VersionInstallationPopup):
+
+    def __init__(self, app, launch_data : LaunchData, version : Version):
+        self.version_name = f"Forge {launch_data.version}-{launch_data.subversion}"
+
+        #task_list = ("Load forge", "Load version", "Load JVM", "Download forge version", "Install forge", "Resolve libraries", "Download vanilla version")
+        #task_types = [VersionLoadedEvent, VersionLoadedEvent, JarFoundEvent, DownloadCompleteEvent, ForgePostProcessedEvent, LibrariesResolvedEvent, DownloadCompleteEvent]
+        task_list = tuple(app.translations["forge_tasks"]) # Task names translated
+
+        # Aux variables to distinguish regular load and download events from forge events
+        self.forge_loaded = False
+        self.forge_downloaded = False
+
+        super().__init__(app, self.version_name, task_list, version)
+
+    def handle_event(self):
+
+        while not self.queue.empty():
+            event = self.queue.get()
+            # Tasks 1 (Forge version loaded) and 2 (Vanilla version loaded)
+            if isinstance(event, VersionLoadedEvent):
+                if not self.forge_loaded:
+                    print("TASK 1 (Load Forge version) DONE")
+                    self.tasks[0].select()
+                    self.forge_loaded = True
+                else:
+                    print("TASK 2 load (Vanilla version) DONE")
+                    self.tasks[1].select()
+
+            # Task 3 (Load JVM)
+            elif isinstance(event, JarFoundEvent):
+                print("TASK 3 (load JVM) DONE")
+                self.tasks[2].select()
+
+            # Task 4 (Download Forge version)
+            elif isinstance(event, DownloadStartEvent) and not self.forge_downloaded: # Download start
+                print("Task 4 (download forge) START")
+                self.window = ProgressBarWindow(f"Downloading {self.version_name}")
+                self.window.set_total(event.entries_count)
+            elif isinstance(event, DownloadCompleteEvent) and not self.forge_downloaded: # Download end
+                print("Task 4 (download forge) DONE")
+                self.tasks[3].select()
+                self.window.finish()  # Close progress bar window
+                self.forge_downloaded = True # Now forge has been downloaded, mark it. Next download will be vanilla version
+                self.grab_set() # Reclaim focus
+
+            # Task 5 ("compile" and install Forge version)
+            elif isinstance(event, ForgePostProcessedEvent):
+                print("TASK 5 (Forge compilation and installation) DONE")
+                self.tasks[4].select()
+
+            # Task 6 (Library resolution)
+            elif isinstance(event, LibrariesResolvedEvent):
+                print("TASK 6 (Libraries resolved) DONE")
+                self.tasks[5].select()
+
+            elif isinstance(event, DownloadStartEvent): # and self.forge_downloaded
+                print("Task 7 (Download Vanilla version) START")
+                self.window = ProgressBarWindow(f"Downloading {self.version_name}")
+                self.window.set_total(event.entries_count)
+            elif isinstance(event, DownloadCompleteEvent): # and self.forge_downloaded
+                print("TASK 7 (Download Forge version) DONE")
+                self.tasks[6].select()
+                self.window.finish()  # Close progress bar window
+                self.destroy()  # End
+                return
+
+            # General purpose download update event
+            elif isinstance(event, DownloadProgressEvent):
+                self.window.update_progress(event.count, event.speed)
+
+        self.after(100, self.handle_event)
+
+        # Just in case some step was skipped. if we are done, end the process
+        if self.future.done():
+            self.destroy()
+            return
+
+    def get_env(self) -> Environment | None:
+        return self.future.result()
@@ -2,12 +2,28 @@ from PIL import Image
 import customtkinter as ctk
 from tkinter import filedialog
 from launch_managers.generic import launch
-from util.get_versions import get_vanilla_versions, get_forge_versions, get_modpack_versions
+from util.get_versions import get_vanilla_versions, get_forge_versions, get_modpack_versions, build_version_cache
 from app_utils.config_manager import Configuration
 from app_utils.launch_data_manager import LaunchData
 from app_utils.translation_manager import Translations
 from util.utilities import get_default_path, check_if_path_is_valid
 from custom_toplevels.ctk_scrollable_dropdown import  CTkScrollableDropdown
+from custom_toplevels.popup_wait import popup_wait_for_task
+from custom_toplevels.popup_download import download_stuff, wait_for_download
+from custom_toplevels.modpack_download_error_window import ModpackDownloadError
+from custom_toplevels.success_window import SuccessWindow
+from launch_managers.version_installation_popup import VanillaInstallationPopup, ForgeInstallationPopup
+from launch_managers.launch_with_logger_window import LaunchWithLoggerPopup
+from launch_managers.environment_cache import repair_installation
+from launch_managers.modpack_prefetch import (prefetch_modpacks, get_installed_modpacks, PREFETCH_DELAY,
+                                              PREFETCH_INTERVAL)
+from app_utils.progress_reporter import ProgressReporter
+from util.ensure_git import ensure_git
+from util.lan_mirror import configure_mirror
+from util.mirror_server import start_mirror_server
+from threading import Thread
+from portablemc.forge import ForgeVersion
+from portablemc.standard import Environment, Version
 
 """
 Default font:
@@ -15,7 +31,7 @@ Roboto 13
 """
 
 
-class App(ctk.CTk):
+class App(ctk.CTk, ProgressReporter):
 
     VERSION_TYPES = ["Vanilla", "Forge", "Modpack"]
 
@@ -27,6 +43,16 @@ class App(ctk.CTk):
         # load config.ini to dictionary
         self.cfg = Configuration()
 
+        # LAN mirror: serve downloads to the other launchers of the LAN and / or download from one first
+        if self.cfg["MAIN"]["mirror_serve"]:
+            start_mirror_server(self.cfg)
+        configure_mirror(self.cfg)
+
+        # Version lists (vanilla, forge, modpacks) are accessed through this cache
+        # Start loading all of them in the background right away, so that they're ready by the time they're needed
+        self.version_cache = build_version_cache(self.cfg)
+        self.version_cache.prefetch()
+
         # Translations need to be loaded early so that widgets can assign text variables
         self.translations = Translations(self.cfg["MAIN"]["language"])
 
@@ -103,8 +129,11 @@ class App(ctk.CTk):
         self.modpack_name = ctk.CTkOptionMenu(self.modpack_frame, values=[""]
                                               , width = 300)
         self.modpack_name_dropdown = CTkScrollableDropdown(self.modpack_name,
-                                                              values=[""])
+                                                              values=[""],
+                                                              command=self.update_modpack_info)
         self.modpack_name.grid(columnspan = 2, sticky = "w", padx = 20, pady = 10)
+        self.modpack_info_label = ctk.CTkLabel(self.modpack_frame, text="")
+        self.modpack_info_label.grid(row = 1, columnspan = 2, sticky = "w", padx = 20, pady = (0, 10))
 
         """ (Launch) Parameters frame """
         self.parameters_frame = ctk.CTkFrame(self)
@@ -139,6 +168,16 @@ class App(ctk.CTk):
                                                              text=self.translations["browse_path_button"])
         self.browse_installation_path_button.grid(row=4, padx=(10, 30), pady=(0, 10), sticky="e")
 
+        self.repair_installation_button = ctk.CTkButton(self.parameters_frame, width=260, height=20,
+                                                        command=self.repair_installation,
+                                                        text=self.translations["repair_installation_button"])
+        self.repair_installation_button.grid(row=5, padx=30, pady=(0, 10))
+
+        self.refresh_versions_button = ctk.CTkButton(self.parameters_frame, width=260, height=20,
+                                                     command=self.refresh_versions,
+                                                     text=self.translations["refresh_versions_button"])
+        self.refresh_versions_button.grid(row=6, padx=30, pady=(0, 10))
+
         """ Easter Egg """
         self.bomb_easter_egg_image = ctk.CTkImage(Image.open("assets/bomb.png"), size=(140, 140))
         self.bomb_easter_egg = ctk.CTkLabel(self, width=140, height=140, image=self.bomb_easter_egg_image,
@@ -190,23 +229,23 @@ class App(ctk.CTk):
         self.enable_terror_easter_egg = ctk.CTkCheckBox(self.side_frame, text="", width=10, height=10,
                                                         command=self.toggle_terror_easter_egg)
         self.enable_terror_easter_egg.grid(row=3 , sticky="e", padx=(0, 20), pady=0)
-        if self.cfg["MAIN"]["show_terror"] == 1:
+        if self.cfg["MAIN"]["show_terror"]:
             self.enable_terror_easter_egg.select()
         else:
             self.enable_terror_easter_egg.deselect()
-        self.toggle_terror_easter_egg(write=False)
+        self.toggle_terror_easter_egg()
 
         """ Launch button """
         self.launch_button = ctk.CTkButton(self, text=self.translations["launch_button"], command=self.launch_game)
         self.launch_button.grid(row=4, column=0, columnspan=2, sticky="ew", padx=40, pady=(0, 10))
 
         # Now that everything is initialized:
-        self.change_appearance_mode(self.cfg["MAIN"]["theme"], write=False)
+        self.change_appearance_mode(self.cfg["MAIN"]["theme"])
         self._correct_language_selector_fg_color()
         if not self.cfg["MAIN"]["show_side_menu"]:
             # The toggle function flips it, so we pre-flip it to get it back to where we want it to
             self.cfg["MAIN"]["show_side_menu"] = not self.cfg["MAIN"]["show_side_menu"]
-            self.toggle_side_menu(write=False)
+            self.toggle_side_menu()
 
         # Load launch data
         self.launch_data = LaunchData() # If there exists launch_data.json, loads it. Otherwise, defaults
@@ -228,16 +267,19 @@ class App(ctk.CTk):
             self.modpack_name.set(self.launch_data.modpack)
         self.update_versions(self.launch_data.version_type)
 
+        # Outdated version lists are refreshed in the background, keep an eye on them to update the dropdowns
+        self.after(0, self.handle_version_cache_updates)
+        # Opt-in: modpack updates are downloaded while the launcher is idle, so that launching them is quicker
+        self.after(PREFETCH_DELAY, self.prefetch_modpack_updates)
+
         print("--- INITIALIZATION FINALIZED ---")
 
-    def toggle_side_menu(self, write=True):
+    def toggle_side_menu(self):
 
         print(f"Toggling side menu to {"show" if not self.cfg["MAIN"]["show_side_menu"] else "hide"}")
 
         # On button press, flip it
         self.cfg["MAIN"]["show_side_menu"] = not self.cfg["MAIN"]["show_side_menu"]
-        if write:
-            self.cfg.write_ini()
 
         # hide
         if not self.cfg["MAIN"]["show_side_menu"]:
@@ -271,7 +313,7 @@ class App(ctk.CTk):
 
             self.grid_columnconfigure(2, weight=1)
 
-    def change_appearance_mode(self, new_appearance_mode, write=True):
+    def change_appearance_mode(self, new_appearance_mode):
         self.light_theme_selector.configure(fg_color="transparent")
         self.dark_theme_selector.configure(fg_color="transparent")
         if new_appearance_mode == "Light":
@@ -281,8 +323,6 @@ class App(ctk.CTk):
 
         ctk.set_appearance_mode(new_appearance_mode)
         self.cfg["MAIN"]["theme"] = new_appearance_mode
-        if write:
-            self.cfg.write_ini()
 
     def change_on_launch_behaviour(self, new_behaviour):
         if new_behaviour == self.translations["on_launch_nothing"]:
@@ -291,9 +331,8 @@ class App(ctk.CTk):
             self.cfg["MAIN"]["on_launch"] = "success_window"
         elif new_behaviour == self.translations["on_launch_logger"]:
             self.cfg["MAIN"]["on_launch"] = "logger"
-        self.cfg.write_ini()
 
-    def toggle_terror_easter_egg(self, write=True):
+    def toggle_terror_easter_egg(self):
         """
         Read the current value of enable_terror_easter_egg and show or hide the image accordingly
         """
@@ -307,9 +346,7 @@ class App(ctk.CTk):
             self.bomb_easter_egg.configure(image=self.bomb_easter_egg_image)
             self.bomb_easter_egg.image = self.bomb_easter_egg_image
 
-        self.cfg["MAIN"]["show_terror"] = self.enable_terror_easter_egg.get()  # 0 or 1
-        if write:
-            self.cfg.write_ini()
+        self.cfg["MAIN"]["show_terror"] = self.enable_terror_easter_egg.get() == 1  # Checkbox value is 0 or 1
 
     def update_versions(self, choice):
         # choice must be accepted as a parameter or the function will raise an error
@@ -333,7 +370,7 @@ class App(ctk.CTk):
             self.vanilla_frame.grid(row=2, columnspan=2, sticky="nswe", padx=0, pady=5)
 
             #version_list will be a list of versions
-            version_list = get_vanilla_versions(".", self)
+            version_list = get_vanilla_versions(self)
 
             # Set the parent version field values
             self.vanilla_version_dropdown.configure(values=version_list)
@@ -346,22 +383,22 @@ class App(ctk.CTk):
             # Grid (show) the forge frame
             self.forge_frame.grid(row=2, columnspan=2, sticky="nswe", padx=0, pady=5)
 
-            # version_list will be a dictionary where {parent_version : forge_subversions}
-            version_list = get_forge_versions(".", self)
+            # forge_catalog contains every forge version and its subversions
+            forge_catalog = get_forge_versions(self)
 
             # Set the version field values
-            self.forge_version_dropdown.configure(values=list(version_list.keys()))
+            self.forge_version_dropdown.configure(values=forge_catalog.get_versions())
 
             # Keep current selection (set said version's subversions
             # Only if version selected and that version has forge
-            if self.forge_version.get() and self.forge_version.get() in version_list:
-                self.forge_subversion_dropdown.configure(values=version_list[self.forge_version.get()])
+            if self.forge_version.get() and self.forge_version.get() in forge_catalog:
+                self.forge_subversion_dropdown.configure(values=forge_catalog.get_subversions(self.forge_version.get()))
 
             else: # default
                 print("DEBUG: Bad or None forge version, going back to default")
-                default_forge_version = list(version_list.keys())[0] # First one in dict (latest)
+                default_forge_version = forge_catalog.get_versions()[0] # Newest version
                 self.forge_version.set(default_forge_version)
-                self.forge_subversion_dropdown.configure(values=version_list[default_forge_version])
+                self.forge_subversion_dropdown.configure(values=forge_catalog.get_subversions(default_forge_version))
                 self.forge_subversion.set("latest") # By default, we'll always use latest
 
 
@@ -369,19 +406,57 @@ class App(ctk.CTk):
             # Grid (show) the modpack frame
             self.modpack_frame.grid(row=2, columnspan=2, sticky="nswe", padx=0, pady=5)
 
-            # version_list will be a list of modpack names
-            version_list = get_modpack_versions(".", self)
+            # modpack_catalog contains every modpack's name and info
+            modpack_catalog = get_modpack_versions(self)
 
-            self.modpack_name_dropdown.configure(values=version_list)
-            # TODO: Cache date should be updated here
+            self.modpack_name_dropdown.configure(values=modpack_catalog.get_names())
 
             if not self.modpack_name.get():
-                self.modpack_name.set(version_list[0])
+                self.modpack_name.set(modpack_catalog.get_names()[0])
+            self.update_modpack_info(self.modpack_name.get())
 
         self.update_status("idle")  # Return the launcher status to idle after the versions have been loaded
 
         return
 
+    def handle_version_cache_updates(self):
+        """
+        Reads the version cache's updates queue (sources refreshed in the background) and, if the refreshed source is
+        the one being displayed, reloads its dropdowns. Current selections are kept by update_versions.
+
+        Keeps calling itself every 500ms (Tkinter widgets can only be updated from the main thread)
+        """
+        while not self.version_cache.updates.empty():
+            name = self.version_cache.updates.get()
+            print(f"{name} versions were refreshed in the background")
+            if self.version_type.get().lower() == name:
+                self.update_versions(self.version_type.get())
+
+        self.after(500, self.handle_version_cache_updates)
+
+    def prefetch_modpack_updates(self):
+        """
+        Starts a background prefetch of the updates of the selected modpack or of every installed one
+        (cfg["MAIN"]["prefetch_modpacks"], see launch_managers/modpack_prefetch.py) unless the launcher is busy
+
+        Keeps calling itself every PREFETCH_INTERVAL ms
+        """
+        self.after(PREFETCH_INTERVAL, self.prefetch_modpack_updates)
+
+        mode = self.cfg["MAIN"]["prefetch_modpacks"]
+        if mode == "off" or self.launch_button.cget("state") == "disabled":
+            return
+
+        path = self.input_installation_path.get()
+        installed = get_installed_modpacks(path)
+        if mode == "selected":
+            modpacks = [modpack for modpack in installed if modpack == self.modpack_name.get()]
+        else:
+            modpacks = installed
+        if modpacks:
+            # Launches pause the prefetch, its thread doesn't keep the launcher open
+            Thread(target=prefetch_modpacks, args=(path, modpacks, self.cfg), daemon=True).start()
+
     def update_subversions(self, parent_version):
         """
         Forge version selector's action listener
@@ -393,14 +468,32 @@ class App(ctk.CTk):
 
         print(f"Updating forge subversions for {parent_version}")
         self.forge_version.set(parent_version)
-        version_list = get_forge_versions(".", self)
 
-        subversion_list = version_list[parent_version]  # In this case choice = self.version_number.get()
+        # The catalog was already loaded by update_versions, so it's just an in-memory lookup
+        forge_catalog = self.version_cache.peek("forge")
+        if forge_catalog is None:
+            forge_catalog = get_forge_versions(self)
+            self.update_status("idle")  # Return the launcher status to idle after the versions have been loaded
+
+        subversion_list = forge_catalog.get_subversions(parent_version)  # In this case choice = self.version_number.get()
         self.forge_subversion_dropdown.configure(values=subversion_list)
         # Every time the version changes, we default to lastest to prevent the previous subversion from being kept
         self.forge_subversion.set("latest")
 
-        self.update_status("idle")  # Return the launcher status to idle after the versions have been loaded
+    def update_modpack_info(self, modpack):
+        """
+        Modpack selector's action listener
+        Selects the modpack and displays its info (forge version and mod count) from the cached modpack catalog
+        """
+        self.modpack_name.set(modpack)
+
+        modpack_catalog = self.version_cache.peek("modpack")
+        info = modpack_catalog.get_info(modpack) if modpack_catalog is not None else None
+        if info is None:
+            self.modpack_info_label.configure(text="")
+            return
+        self.modpack_info_label.configure(text=self.translations["modpack_info_label"].format(
+            info["version"], info["subversion"], info["mod_count"]))
 
     def update_ram_slider(self, choice):
         self.input_ram_value_label.configure(text=f"{choice} GB")
@@ -421,6 +514,29 @@ class App(ctk.CTk):
         self.input_installation_path.delete(0, ctk.END)  # Delete current path
         self.input_installation_path.insert(0, path)  # add read path
 
+    def repair_installation(self):
+        """
+        Hashes every installed file of the installation path, broken files will be downloaded again on next launch
+        """
+        path = self.input_installation_path.get()
+        if not check_if_path_is_valid(path):
+            self.update_status("error", self.translations["status_error_invalid_path"])
+            return
+
+        self.update_status("working", self.translations["status_working_repairing"])
+        checked, broken = popup_wait_for_task(self, self.translations["status_working_repairing"],
+                                              repair_installation, path)
+        self.update_status("success", self.translations["status_success_repaired"].format(checked, broken))
+
+    def refresh_versions(self):
+        """
+        Expires every cached version list. The displayed one is refreshed in the background right away (its dropdowns
+        are reloaded by handle_version_cache_updates), the rest once they are displayed
+        """
+        print(f"DEBUG: Version cache stats: {self.version_cache.get_stats()}")
+        self.version_cache.expire()
+        self.update_versions(self.version_type.get())
+
     def _correct_language_selector_fg_color(self):
         self.english_language_selector.configure(fg_color="transparent")
         self.spanish_language_selector.configure(fg_color="transparent")
@@ -446,6 +562,8 @@ class App(ctk.CTk):
         self.input_installation_path_label.configure(text=self.translations["installation_path_label"])
         self.reset_installation_path_button.configure(text=self.translations["reset_path_button"])
         self.browse_installation_path_button.configure(text=self.translations["browse_path_button"])
+        self.repair_installation_button.configure(text=self.translations["repair_installation_button"])
+        self.refresh_versions_button.configure(text=self.translations["refresh_versions_button"])
 
         self.on_launch_selector.configure(values=[self.translations["on_launch_nothing"],
                                                  self.translations["on_launch_success_window"],
@@ -460,7 +578,6 @@ class App(ctk.CTk):
         self.launch_button.configure(text=self.translations["launch_button"])
         self.update_status("idle")  # So that the status bar text updates
         self.cfg["MAIN"]["language"] = choice
-        self.cfg.write_ini()
 
         self._correct_language_selector_fg_color()
 
@@ -583,7 +700,45 @@ class App(ctk.CTk):
         self.status_indicator.update()  # Just in case
         return
 
+    """ ProgressReporter implementation, used by the launch managers (see app_utils/progress_reporter.py) """
+
+    def wait_for_task(self, message: str, function, *args):
+        return popup_wait_for_task(self, message, function, *args)
+
+    def install_version(self, launch_data: LaunchData, version: Version) -> Environment:
+        if isinstance(version, ForgeVersion):
+            popup = ForgeInstallationPopup(self, launch_data, version)
+        else:
+            popup = VanillaInstallationPopup(self, launch_data, version)
+        popup.wait_window()
+        return popup.get_env()
+
+    def download(self, dest: str, stuff: dict, title: str) -> list:
+        return download_stuff(dest, stuff, title)
+
+    def wait_for_download(self, title: str, future, progress) -> list:
+        return wait_for_download(title, future, progress)
+
+    def ask_download_error(self, launch_data: LaunchData, failed_downloads: list) -> bool | None:
+        error_popup = ModpackDownloadError(self, launch_data, failed_downloads)
+        error_popup.wait_window()  # Wait until the popup closes (choice made)
+        return error_popup.get_choice()
+
+    def ensure_git(self, launch_data: LaunchData) -> bool:
+        return ensure_git(self, launch_data)
+
+    def run_game(self, launch_data: LaunchData, env: Environment):
+        if self.cfg["MAIN"]["on_launch"] == "nothing":
+            Thread(target=env.run).start()
+        elif self.cfg["MAIN"]["on_launch"] == "success_window":
+            Thread(target=env.run).start()
+            SuccessWindow(self)
+        elif self.cfg["MAIN"]["on_launch"] == "logger":
+            LaunchWithLoggerPopup(self, launch_data, env)
+
 
 if __name__ == "__main__":
     app = App()
     app.mainloop()
+    app.cfg.flush() # Save pending configuration changes
+    print(f"DEBUG: Version cache stats: {app.version_cache.get_stats()}")
@@ -0,0 +1,333 @@
+import os
+import ssl
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Empty
+from threading import local, Lock
+from time import time, sleep
+from urllib.parse import urlsplit, urljoin, quote
+from util.utilities import load_json, save_json
+from util.lan_mirror import mirror_urls, is_mirror_url, mark_mirror_down
+
+"""
+    Download engine used to download mods (and other files) without depending on the GUI.
+
+    Each file can have several URLs (mirrors). Interrupted downloads and temporary server errors are retried on the
+    same URL with exponential backoff, once a URL is given up on (or is simply broken, ex: 404), the next one is used.
+    The LAN mirror (util/lan_mirror.py), if any, is tried first and isn't retried.
+
+    Files are downloaded by a bounded pool of worker threads. Each worker keeps its connections open (HTTP keep-alive)
+    and reuses them for every file it downloads from the same host, so that a 150 mod modpack doesn't pay for 150
+    TCP + TLS handshakes. Workers report their progress through a queue, the thread that called download_files
+    aggregates it and calls the progress callback, so the callback can safely touch Tk widgets.
+"""
+
+DOWNLOAD_WORKERS = 8
+DOWNLOAD_TIMEOUT = 30 # Seconds without receiving anything before giving up on a file
+MAX_REDIRECTS = 5
+DOWNLOAD_RETRIES = 3 # Attempts to resume an interrupted download before giving up on its URL
+RETRY_BACKOFF = 1 # Seconds before the first retry, doubled after each attempt
+CHUNK_SIZE = 64 * 1024
+PROGRESS_INTERVAL = 0.1 # Seconds between progress reports
+USER_AGENT = "PyMinecraft-Launcher"
+
+
+class DownloadError(Exception):
+    """
+    Raised when a file can't be downloaded (HTTP error status, too many redirects...)
+    """
+    pass
+
+
+class TemporaryDownloadError(DownloadError):
+    """
+    Raised when the server fails in a way that might not happen again (HTTP 429, 5xx), the download can be retried
+    """
+    pass
+
+
+class ConnectionPool:
+    """
+    Keep-alive connections of the current thread, one per host. Each worker thread has its own connections
+    (http.client connections can't be shared between threads)
+    """
+
+    def __init__(self):
+        self._local = local()
+        self._ssl_context = ssl.create_default_context()
+        self._opened = [] # Every connection opened by any thread, to close them once the download is finished
+        self._lock = Lock()
+
+    def get(self, scheme: str, netloc: str) -> http.client.HTTPConnection:
+        connections = self._get_connections()
+        connection = connections.get((scheme, netloc))
+        if connection is None:
+            if scheme == "https":
+                connection = http.client.HTTPSConnection(netloc, timeout=DOWNLOAD_TIMEOUT, context=self._ssl_context)
+            elif scheme == "http":
+                connection = http.client.HTTPConnection(netloc, timeout=DOWNLOAD_TIMEOUT)
+            else:
+                raise DownloadError(f"Unsupported URL scheme: {scheme}")
+            connections[(scheme, netloc)] = connection
+            with self._lock:
+                self._opened.append(connection)
+        return connection
+
+    def discard(self, scheme: str, netloc: str) -> None:
+        """
+        Closes the connection to the given host (broken or closed by the server), next get will open a new one
+        """
+        connection = self._get_connections().pop((scheme, netloc), None)
+        if connection is not None:
+            connection.close()
+
+    def close(self) -> None:
+        """
+        Closes the connections of every thread, must be called once all threads are done with them
+        """
+        with self._lock:
+            for connection in self._opened:
+                connection.close()
+            self._opened.clear()
+
+    def _get_connections(self) -> dict:
+        if not hasattr(self._local, "connections"):
+            self._local.connections = {}
+        return self._local.connections
+
+
+def _request(pool: ConnectionPool, url: str, headers: dict | None = None) -> http.client.HTTPResponse:
+    """
+    GET request following redirects, returns the response of the final URL (status 200, 206 or 416)
+    """
+    for _ in range(MAX_REDIRECTS + 1):
+        parts = urlsplit(url)
+        path = quote(parts.path or "/", safe="/%:@&=+$,;~!*'()")
+        if parts.query:
+            path += "?" + parts.query
+        request_headers = {"User-Agent": USER_AGENT, "Accept": "*/*"}
+        request_headers.update(headers or {})
+
+        # A connection that has been idle for a while may have been closed by the server, retry once with a new one
+        for attempt in range(2):
+            connection = pool.get(parts.scheme, parts.netloc)
+            try:
+                connection.request("GET", path, headers=request_headers)
+                response = connection.getresponse()
+                break
+            except (http.client.RemoteDisconnected, http.client.CannotSendRequest, ConnectionError):
+                pool.discard(parts.scheme, parts.netloc)
+                if attempt == 1:
+                    raise
+
+        if response.status in (301, 302, 303, 307, 308):
+            location = response.getheader("Location")
+            response.read() # The body must be read before the connection can be used again
+            if location is None:
+                raise DownloadError(f"HTTP {response.status} without Location")
+            url = urljoin(url, location)
+            continue
+
+        if response.status not in (200, 206, 416):
+            response.read()
+            if response.status == 429 or response.status >= 500:
+                raise TemporaryDownloadError(f"HTTP {response.status}")
+            raise DownloadError(f"HTTP {response.status}")
+
+        return response
+
+    raise DownloadError("Too many redirects")
+
+
+def _get_total_size(response: http.client.HTTPResponse, offset: int) -> int | None:
+    """
+    Full size of the file being downloaded (not only of the requested range), None if unknown
+    """
+    content_range = response.getheader("Content-Range") # bytes start-end/total
+    if content_range is not None and "/" in content_range:
+        total = content_range.rsplit("/", maxsplit=1)[1]
+        return int(total) if total.isdigit() else None
+
+    content_length = response.getheader("Content-Length")
+    if content_length is not None and content_length.isdigit():
+        return offset + int(content_length)
+    return None
+
+
+def _download_file(pool: ConnectionPool, urls: list, path: str, queue: Queue) -> None:
+    """
+    Downloads path from the first of urls (mirrors) that works, reports the downloaded bytes to queue
+    """
+    for i, url in enumerate(urls):
+        try:
+            # If the LAN mirror fails, going upstream right away is quicker than retrying it
+            _download_from(pool, url, path, queue, retries=1 if is_mirror_url(url) else DOWNLOAD_RETRIES)
+            return
+        except (DownloadError, http.client.HTTPException, OSError) as error:
+            if is_mirror_url(url) and isinstance(error, OSError):
+                mark_mirror_down(error)
+            if i == len(urls) - 1:
+                raise
+            print(f"WARNING: Download of {os.path.basename(path)} failed ({error}), trying mirror {urls[i + 1]}")
+            # The part file comes from another server, it can't be resumed safely
+            for part_file in (path + ".part", path + ".part.json"):
+                try:
+                    os.remove(part_file)
+                except FileNotFoundError:
+                    pass
+
+
+def _download_from(pool: ConnectionPool, url: str, path: str, queue: Queue, retries: int = DOWNLOAD_RETRIES) -> None:
+    """
+    Downloads url in path, reports the downloaded bytes to queue
+
+    The file is written to path.part and only renamed to path once it is complete, so that an interrupted download
+    never leaves a truncated file behind. Part files are kept when a download fails, the next attempt (right away or in
+    a later launch) resumes it with a Range request. path.part.json stores what's needed to check that the file on
+    the server is still the same one (ETag / Last-Modified and size).
+    """
+    part_path = path + ".part"
+    info_path = part_path + ".json"
+
+    for attempt in range(retries):
+        offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+        try:
+            info = load_json(info_path) if offset else {}
+        except (FileNotFoundError, ValueError):
+            info = {}
+
+        headers = {}
+        if offset and (info.get("validator") or info.get("size")):
+            headers["Range"] = f"bytes={offset}-"
+            if info.get("validator"):
+                # The server sends the whole file instead (200) if it changed
+                headers["If-Range"] = info["validator"]
+
+        try:
+            response = _request(pool, url, headers)
+
+            if response.status == 416:
+                # Range not satisfiable, the part file is either complete or bigger than the file on the server
+                response.read()
+                if offset and _get_total_size(response, 0) == offset == info.get("size"):
+                    break
+                os.remove(part_path)
+                continue
+
+            total_size = _get_total_size(response, offset if response.status == 206 else 0)
+            if response.status == 206 and (total_size != info.get("size", total_size)
+                                           or not response.getheader("Content-Range", "").startswith(f"bytes {offset}-")):
+                # Not the range we asked for (or the file changed), start from scratch
+                response.read()
+                os.remove(part_path)
+                continue
+
+            if response.status == 200:
+                # New download (or the server doesn't support ranges / the file changed)
+                offset = 0
+                validator = response.getheader("ETag") or response.getheader("Last-Modified")
+                if validator is not None and validator.startswith("W/"):
+                    validator = None # Weak ETags can't be used with If-Range
+                save_json({"validator": validator, "size": total_size}, info_path)
+
+            with open(part_path, "ab" if response.status == 206 else "wb") as file:
+                while chunk := response.read(CHUNK_SIZE):
+                    file.write(chunk)
+                    queue.put(len(chunk))
+
+            if total_size is not None and os.path.getsize(part_path) != total_size:
+                raise http.client.IncompleteRead(b"", total_size - os.path.getsize(part_path))
+            break
+
+        except (TemporaryDownloadError, http.client.HTTPException, OSError) as error:
+            # Connection dropped, timeout, server overloaded... Don't reuse a connection in an unknown state and resume
+            # the download after a while
+            parts = urlsplit(url)
+            pool.discard(parts.scheme, parts.netloc)
+            if attempt == retries - 1:
+                raise
+            wait = RETRY_BACKOFF * 2 ** attempt
+            print(f"WARNING: Download of {os.path.basename(path)} interrupted ({error}), resuming in {wait}s")
+            sleep(wait)
+    else:
+        raise DownloadError("Download couldn't be completed")
+
+    os.replace(part_path, path)
+    try:
+        os.remove(info_path)
+    except FileNotFoundError:
+        pass
+
+
+def download_files(dest: str, stuff: dict, on_progress=None, workers: int = DOWNLOAD_WORKERS) -> list:
+    """
+    Downloads stuff in dest, each file is left in dest/name_of_file
+    Doesn't depend on the GUI, progress is reported through on_progress, which is always called from the thread that
+    called download_files.
+
+    Args:
+        dest: Destination folder (should NOT end in /)
+        stuff: dictionary where {name of the file : download URL or list of URLs (mirrors, tried in order)}
+        on_progress: on_progress(downloaded files, total files, downloaded bytes, speed in bytes/s)
+        workers: Files downloaded at the same time
+
+    Returns:
+        List containing all the files that failed to download
+    """
+
+    os.makedirs(dest, exist_ok=True)
+    pool = ConnectionPool()
+    queue = Queue() # Workers put downloaded byte counts and ("done", file, error) when a file is finished
+
+    def worker(file, urls):
+        error = None
+        try:
+            _download_file(pool, mirror_urls([urls] if isinstance(urls, str) else urls), dest + f"/{file}", queue)
+        except Exception as exception:
+            error = exception
+        queue.put(("done", file, error))
+
+    failed_downloads = []
+    done_count = 0
+    total_bytes = 0
+    last_report = start = time()
+    last_report_bytes = 0
+    speed = 0.0
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(stuff)))) as executor:
+        for file, urls in stuff.items():
+            executor.submit(worker, file, urls)
+
+        if on_progress is not None:
+            on_progress(0, len(stuff), 0, 0.0)
+
+        while done_count < len(stuff):
+            try:
+                message = queue.get(timeout=PROGRESS_INTERVAL)
+            except Empty:
+                message = None
+
+            finished = False
+            if isinstance(message, int):
+                total_bytes += message
+            elif message is not None:
+                _, file, error = message
+                done_count += 1
+                finished = True
+                if error is not None:
+                    print(f"ERROR: File download failed! {file} ({error})")
+                    failed_downloads.append(file)
+
+            now = time()
+            if finished or now - last_report >= PROGRESS_INTERVAL:
+                if now - last_report >= PROGRESS_INTERVAL:
+                    speed = (total_bytes - last_report_bytes) / (now - last_report)
+                    last_report, last_report_bytes = now, total_bytes
+                if on_progress is not None:
+                    on_progress(done_count, len(stuff), total_bytes, speed)
+
+    pool.close()
+
+    print(f"Downloaded {len(stuff) - len(failed_downloads)}/{len(stuff)} files "
+          f"({total_bytes / 1000000:.2f}Mb in {time() - start:.2f}s)")
+    return failed_downloads
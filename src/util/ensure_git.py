@@ -1,9 +1,10 @@
-from subprocess import call, run
+from subprocess import run
 import customtkinter as ctk
 from app_utils.launch_data_manager import LaunchData
 from custom_toplevels.popup_download import download_stuff
 import os
 from custom_toplevels.popup_wait import popup_wait_for_task
+from util.utilities import is_git_installed
 
 
 class InstallGitPopup(ctk.CTkToplevel):
@@ -113,32 +114,6 @@ class InstallGitPopup(ctk.CTkToplevel):
         return self.choice
 
 
-def is_git_installed():
-    """
-    Return true if git is installed and false otherwise
-    """
-
-    #return False # DEBUG
-
-    # Check if portable git installation present
-    try:
-        portable_git_path = os.getcwd() + "/portable-git"
-        call(f"{portable_git_path}/cmd/git --version") # If this works, portable git installed
-        os.environ['GIT_PYTHON_GIT_EXECUTABLE'] = fr'{portable_git_path}\cmd\git.exe' # Tell GitPython to use that git
-        return True
-    except FileNotFoundError:
-        pass
-
-    # Check if regular git installation present
-    try:
-        call("git --version")
-        return True
-    except FileNotFoundError:
-        pass
-
-    return False
-
-
 def ensure_git(app, launch_data):
     """
     Checks whether git is installed or not:
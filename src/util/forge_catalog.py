@@ -0,0 +1,160 @@
+import re
+
+
+def version_key(version: str) -> tuple:
+    """
+    Sort key for Minecraft and Forge version numbers, so that they're ordered by their numeric value instead of
+    alphabetically (1.12.2 < 1.20.1, 14.23.5.2859 < 47.3.0).
+    Pre-releases come before their release (1.7.10_pre4 < 1.7.10)
+    """
+    base, _, suffix = version.partition("_")
+    return (tuple(int(number) for number in re.findall(r"\d+", base)),
+            0 if suffix else 1,
+            tuple(int(number) for number in re.findall(r"\d+", suffix)))
+
+
+class ForgeCatalog:
+    """
+    All Forge versions available, along with their promotions (latest and recommended Forge version of each
+    Minecraft version).
+
+    Minecraft versions and Forge subversions are sorted newest first. The subversion list of each Minecraft version
+    (the one displayed in the dropdown, "latest" and "recommended" included) is built once, when the catalog is
+    created, so lookups never rebuild lists.
+
+    "latest" and "recommended" aliases are resolved using the promotions stored in the catalog, so that portablemc
+    doesn't have to request them again when launching.
+    """
+
+    ALIASES = ("latest", "recommended")
+
+    def __init__(self, versions: dict, promotions: dict):
+        """
+        Args:
+            versions: {minecraft version : [forge subversions]} already sorted newest first (see from_maven)
+            promotions: {minecraft version : {"latest": forge subversion, "recommended": forge subversion}}
+        """
+        self._versions = versions
+        self._promotions = promotions
+
+        # Index: {minecraft version : [dropdown subversions]}
+        self._subversions = {version: list(self.ALIASES) + subversions
+                             for version, subversions in self._versions.items()}
+        self._version_list = list(self._versions.keys())
+
+    @classmethod
+    def from_maven(cls, maven_versions: list, promos: dict):
+        """
+        Builds the catalog from Forge's maven metadata and promotions
+
+        Args:
+            maven_versions: Full Forge version ids, ex: ["1.20.1-47.3.0", "1.7.10-10.13.4.1614-1.7.10", ...]
+            promos: Forge's promotions_slim.json "promos", ex: {"1.20.1-latest": "47.3.0", ...}
+        """
+        versions = {}
+        for full_version in maven_versions:
+            # Some old versions have a suffix (1.7.10-10.13.4.1614-1.7.10), portablemc handles it by itself
+            version, subversion = full_version.split("-")[:2]
+            versions.setdefault(version, []).append(subversion)
+
+        # Sorting is slow-ish (~20ms), so it's only done here and not every time the catalog is loaded from cache
+        sorted_versions = {}
+        for version in sorted(versions, key=version_key, reverse=True):
+            sorted_versions[version] = sorted(versions[version], key=version_key, reverse=True)
+
+        promotions = {}
+        for promo, subversion in promos.items():
+            version, alias = promo.rsplit("-", maxsplit=1)
+            if alias in cls.ALIASES:
+                promotions.setdefault(version, {})[alias] = subversion
+
+        return cls(sorted_versions, promotions)
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """
+        Builds the catalog from a dictionary made by to_dict (ex: loaded from a cache file), which is already sorted
+        """
+        return cls(data["versions"], data["promotions"])
+
+    def to_dict(self) -> dict:
+        return {"versions": self._versions, "promotions": self._promotions}
+
+    def get_versions(self) -> list:
+        """
+        Returns all Minecraft versions that have Forge, newest first
+        """
+        return self._version_list
+
+    def get_subversions(self, version: str) -> list:
+        """
+        Returns the subversion list of the given Minecraft version: aliases first and then all Forge subversions
+        (newest first)
+        Raises KeyError if the version doesn't have Forge
+        """
+        return self._subversions[version]
+
+    def resolve(self, version: str, subversion: str) -> str | None:
+        """
+        Returns the actual Forge subversion of the given subversion (resolves "latest" and "recommended").
+        Some versions don't have a recommended subversion (or vice versa), in which case the other one is used
+        (same as portablemc does).
+
+        Returns None if the alias can't be resolved
+        """
+        if subversion not in self.ALIASES:
+            return subversion
+
+        promotion = self._promotions.get(version, {})
+        other_alias = self.ALIASES[1 - self.ALIASES.index(subversion)]
+        return promotion.get(subversion, promotion.get(other_alias))
+
+    def __contains__(self, version: str) -> bool:
+        return version in self._versions
+
+    def __len__(self):
+        return len(self._versions)
+
+
+def main():
+    """
+    Function only intended for testing and debugging purposes
+    Benchmarks loading the full forge catalog from the old indented json cache file against the binary cache file
+    (cache_forge_versions.bin made by the launcher is used if it exists, a catalog of the same size otherwise)
+    """
+    from os import remove
+    from timeit import timeit
+    from util.utilities import load_json, save_json, load_cache, save_cache, CorruptedFileError
+
+    try:
+        catalog = ForgeCatalog.from_dict(load_cache("cache_forge_versions.bin")["versions"])
+    except (FileNotFoundError, CorruptedFileError):
+        # About as big as the real one: ~80 minecraft versions, ~4000 forge versions
+        maven_versions = [f"1.{minor}.{patch}-{minor + 30}.{build // 10}.{build}"
+                          for minor in range(1, 21) for patch in range(4) for build in range(50)]
+        catalog = ForgeCatalog.from_maven(maven_versions, {})
+
+    subversion_count = sum(len(catalog.get_subversions(version)) for version in catalog.get_versions())
+    print(f"Forge catalog: {len(catalog)} versions, {subversion_count} subversions")
+
+    # Old format: indented json with the subversion lists (aliases included)
+    old_data = {version: catalog.get_subversions(version) for version in catalog.get_versions()}
+    save_json(old_data, "benchmark_forge_versions.json")
+    save_cache({"validators": {}, "versions": catalog.to_dict()}, "benchmark_forge_versions.bin")
+
+    runs = 200
+    json_time = timeit(lambda: load_json("benchmark_forge_versions.json"), number=runs) / runs
+    cache_time = timeit(lambda: load_cache("benchmark_forge_versions.bin"), number=runs) / runs
+    catalog_time = timeit(lambda: ForgeCatalog.from_dict(load_cache("benchmark_forge_versions.bin")["versions"]),
+                          number=runs) / runs
+
+    print(f"json load:           {json_time * 1000:.3f} ms")
+    print(f"binary load:         {cache_time * 1000:.3f} ms ({json_time / cache_time:.1f}x faster)")
+    print(f"binary load + index: {catalog_time * 1000:.3f} ms")
+
+    remove("benchmark_forge_versions.json")
+    remove("benchmark_forge_versions.bin")
+
+
+if __name__ == "__main__":
+    main()
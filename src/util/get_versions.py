@@ -1,178 +1,228 @@
-from portablemc.forge import request_maven_versions
-from portablemc.standard import VersionManifest
-
-from custom_toplevels.popup_wait import popup_wait_for_task
-from util.utilities import load_json, save_json
-from datetime import datetime, timedelta
-import github # PyGithub
-
-
-def fetch_vanilla_versions_from_internet():
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep, time
+from portablemc.http import HttpError, HttpResponse
+from util.lan_mirror import http_request
+from portablemc.standard import VERSION_MANIFEST_URL
+from util.version_cache import VersionCache, CacheSource, NotModified, conditional_request
+from util.forge_catalog import ForgeCatalog
+from util.modpack_catalog import ModpackCatalog
+import xml.etree.ElementTree as ElementTree
+
+# Where the version lists are fetched from (can be pointed to a local server for testing)
+VANILLA_MANIFEST_URL = VERSION_MANIFEST_URL
+FORGE_MAVEN_METADATA_URL = "https://maven.minecraftforge.net/net/minecraftforge/forge/maven-metadata.xml"
+FORGE_PROMOTIONS_URL = "https://files.minecraftforge.net/net/minecraftforge/forge/promotions_slim.json"
+GITHUB_API_URL = "https://api.github.com"
+GITHUB_RAW_URL = "https://raw.githubusercontent.com"
+GITHUB_CODELOAD_URL = "https://codeload.github.com" # Repo archives, doesn't use API quota
+MODPACKS_GITHUB_USER = "CalvonettaModpacks"
+
+GITHUB_MAX_RATE_LIMIT_WAIT = 60 # Seconds, if the rate limit is reset later than this, give up
+
+
+def fetch_vanilla_versions_from_internet(validators : dict):
     """
-    Returns a list with all vanilla version numbers
+    Returns (list with all vanilla version numbers, validators)
+    Raises NotModified if the manifest didn't change since validators were received
     """
 
-    manifest = VersionManifest()
-    manifest.get_version("release")  # This needs to be called in order for the manifest to be fetched
+    res, validators = conditional_request(VANILLA_MANIFEST_URL, validators, "application/json")
+    manifest = res.json()
 
     vanilla_versions = []
-    for version in manifest.data["versions"]:
+    for version in manifest["versions"]:
         if version["type"] == "release":
             vanilla_versions.append(version["id"])
 
-    return vanilla_versions
+    return vanilla_versions, validators
 
 
-def fetch_forge_versions_from_internet():
+def fetch_forge_versions_from_internet(validators : dict):
     """
-    Returns a dict where {version number: [subversion list]}
+    Returns (ForgeCatalog with all forge versions and their promotions, validators)
+    Raises NotModified if neither the maven metadata nor the promotions changed since validators were received
     """
-    maven_versions = request_maven_versions()
 
-    # Now lets display them as a dict where --> {parent version : forge subversions} (we'll remove the "-"s)
+    metadata_validators = validators.get("metadata", {})
+    promotions_validators = validators.get("promotions", {})
 
-    forge_versions = {}
+    # Both are requested conditionally, but if only one of them changed we need the other one too to build the catalog
+    try:
+        metadata, metadata_validators = conditional_request(FORGE_MAVEN_METADATA_URL, metadata_validators, "application/xml")
+    except NotModified:
+        metadata = None
+    try:
+        promotions, promotions_validators = conditional_request(FORGE_PROMOTIONS_URL, promotions_validators, "application/json")
+    except NotModified:
+        if metadata is None:
+            raise
+        promotions, promotions_validators = conditional_request(FORGE_PROMOTIONS_URL, {}, "application/json")
+    if metadata is None:
+        metadata, metadata_validators = conditional_request(FORGE_MAVEN_METADATA_URL, {}, "application/xml")
 
-    for full_ver in maven_versions:
-        splitted_ver = full_ver.split("-")
-        parent_version = splitted_ver[0]
-        forge_subversion = splitted_ver[1]
+    maven_versions = [version.text for version in ElementTree.fromstring(metadata.data).iter("version")]
+    catalog = ForgeCatalog.from_maven(maven_versions, promotions.json()["promos"])
 
-        if parent_version not in forge_versions:  # The parent forge version key doesn't exist in the dict
-            forge_versions[parent_version] = []  # Make it and create the list for the forge subversions
+    return catalog, {"metadata": metadata_validators, "promotions": promotions_validators}
 
-        forge_versions[parent_version].append(forge_subversion)    # append the forge subversion to the parent
-        # version's value list
 
-    # Add latest and recommended subversions in each forge version
-    for version in forge_versions.keys():
-        forge_versions[version].insert(0, "recommended")
-        forge_versions[version].insert(0, "latest")
-
-    return forge_versions
+def github_request(url: str, validators: dict, retries: int = 3) -> tuple[HttpResponse, dict]:
+    """
+    conditional_request to GitHub's API that handles its rate limit and temporary errors.
+    (Conditional requests answered with a 304 don't count towards GitHub's rate limit)
 
+    If the rate limit is reached, waits until it is reset (if that's soon enough). Network and server errors are
+    retried with exponential backoff.
 
-def fetch_modpack_versions_from_the_internet():
+    Raises:
+        NotModified: The content didn't change
+        HttpError: The request failed (even after retrying)
     """
-    Returns a list with all modpack names
+    for attempt in range(retries + 1):
+        try:
+            return conditional_request(url, validators, "application/vnd.github+json")
+        except HttpError as error:
+            status = error.res.status
+            headers = {name.lower(): value for name, value in error.res.headers.items()}
+            if attempt == retries:
+                raise
+
+            if status in (403, 429) and ("retry-after" in headers or headers.get("x-ratelimit-remaining") == "0"):
+                # Rate limit reached
+                if "retry-after" in headers:
+                    wait = int(headers["retry-after"])
+                else:
+                    wait = int(headers.get("x-ratelimit-reset", 0)) - int(time())
+                if wait > GITHUB_MAX_RATE_LIMIT_WAIT:
+                    print(f"ERROR: GitHub rate limit reached, it won't be reset for {wait}s")
+                    raise
+                print(f"WARNING: GitHub rate limit reached, retrying in {wait}s")
+                sleep(max(wait, 1))
+
+            elif status == 0 or status >= 500:
+                # Network error or server error, hopefully temporary
+                print(f"WARNING: GitHub request failed ({status}), retrying in {2 ** attempt}s")
+                sleep(2 ** attempt)
+
+            else:
+                raise
+
+
+def _get_next_page(res: HttpResponse) -> str | None:
     """
-    g = github.Github()
-
-    resul = []
-
-    for repo in g.get_user("CalvonettaModpacks").get_repos():
-        resul.append(repo.name)
-    return resul
+    Returns the URL of the next page of a paginated GitHub API response (Link header), or None if it's the last one
+    """
+    links = {name.lower(): value for name, value in res.headers.items()}.get("link", "")
+    for link in links.split(","):
+        if 'rel="next"' in link:
+            return link[link.index("<") + 1:link.index(">")]
+    return None
 
 
-def get_vanilla_versions(cache_data_path: str, app):
+def fetch_modpack_info(repo: dict) -> dict | None:
     """
-    Function that loads the versions list from a cached file. If no file is found it instead loads
-    the manifest from the internet and creates the cache file.
-    A versions cache file will be considered to be outdated after a day has passed.
+    Fetches the info of the modpack in the given repo (GitHub API repo object) from its modpack_info.json and
+    mods/modlist.json files. Raw files are requested from raw.githubusercontent.com, which doesn't use API quota.
 
-    Args:
-        cache_data_path: Path to the minecraft installation path
-        app: master app
+    Returns {"version": forge version, "subversion": forge subversion, "mod_count": int} or None if the repo
+    doesn't contain a (valid) modpack
     """
+    files_url = f"{GITHUB_RAW_URL}/{MODPACKS_GITHUB_USER}/{repo['name']}/{repo['default_branch']}"
+    try:
+        info = http_request("GET", f"{files_url}/modpack_info.json", accept="application/json").json()
+        modlist = http_request("GET", f"{files_url}/mods/modlist.json", accept="application/json").json()
+        return {"version": info["version"], "subversion": info["subversion"], "mod_count": len(modlist)}
+    except (HttpError, ValueError, KeyError, TypeError) as error:
+        print(f"WARNING: Could not fetch {repo['name']} modpack info: {error}")
+        return None
 
-    versions_cache_file = f"{cache_data_path}\\cache_vanilla_versions.json"
 
-    # If there already exists an updated version cache file, load it and return it
-    app.update_status("working", app.translations["status_working_loading_cached_vanilla_versions"])
+def fetch_modpack_head(modpack: str, branch: str, validators: dict) -> tuple[str, dict]:
+    """
+    Returns (sha of the latest commit of the given branch of a modpack repo, validators)
+    Raises NotModified if it didn't change since validators were received (304, doesn't use API quota)
+    """
+    url = f"{GITHUB_API_URL}/repos/{MODPACKS_GITHUB_USER}/{modpack}/git/ref/heads/{branch}"
+    res, validators = github_request(url, validators, retries=0)
+    return res.json()["object"]["sha"], validators
 
-    now = datetime.now()
 
-    if now - app.cfg["MAIN"]["cache_date_vanilla"] < timedelta(days=1):
-        # Cache is updated, use cache
-        print("Reading vanilla versions from file")
-        try:
-            return load_json(versions_cache_file)
-        except FileNotFoundError:
-            print("ERROR: Reported updated cache but file was not found")
+def fetch_modpack_versions_from_the_internet(validators : dict):
+    """
+    Returns (ModpackCatalog with all modpacks and their info, validators)
+    Raises NotModified if the modpack repos didn't change since validators were received
 
-    print("Reading vanilla versions from the internet")
+    Each modpack's info is fetched concurrently
+    """
 
-    # Load from the internet
-    app.update_status("working", app.translations["status_working_fetching_vanilla_versions"])
-    vanilla_versions = popup_wait_for_task(app, app.translations["status_working_fetching_vanilla_versions"], fetch_vanilla_versions_from_internet)
+    url = f"{GITHUB_API_URL}/users/{MODPACKS_GITHUB_USER}/repos?per_page=100"
+    res, validators = github_request(url, validators)
+    repos = res.json()
 
-    # Save cache
-    app.update_status("working", app.translations["status_working_caching_vanilla_versions"])
-    save_json(vanilla_versions, versions_cache_file)
+    # The response only changes if a repo is pushed to, but if there are several pages, that might happen in any page
+    # We only know the first one didn't change, so the next request can't be conditional
+    next_page = _get_next_page(res)
+    if next_page is not None:
+        validators = {}
+    while next_page is not None:
+        res, _ = github_request(next_page, {})
+        repos += res.json()
+        next_page = _get_next_page(res)
 
-    app.cfg["MAIN"]["cache_date_vanilla"] = now
-    app.cfg.write_ini()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        infos = executor.map(fetch_modpack_info, repos)
 
-    return vanilla_versions
+    modpacks = {repo["name"]: info for repo, info in zip(repos, infos)}
+    return ModpackCatalog(modpacks), validators
 
 
-def get_forge_versions(cache_data_path: str, app):
+def build_version_cache(cfg, path="."):
     """
-    Function that loads the full forge versions list from a cached file. If no file is
-    found it instead loads the manifest from the internet and creates the cache file.
-    A versions cache file will be considered to be outdated after a day has passed.
-
-    Note: the function is a duplicate of the vanilla versions one except the forge versions
-    are saved into a dictionary instead of a list.
-
-    TODO: Find a way of having a single function that handles this instead of 2 that do almost the same
+    Creates the app's VersionCache and registers every version list source in it
 
     Args:
-        cache_data_path: Path to the minecraft installation path
-        app: master app
+        cfg: Configuration object
+        path: Directory where the cache files will be saved
     """
+    cache = VersionCache(cfg, path)
+    cache.register(CacheSource("vanilla", fetch_vanilla_versions_from_internet))
+    cache.register(CacheSource("forge", fetch_forge_versions_from_internet,
+                               encode=ForgeCatalog.to_dict, decode=ForgeCatalog.from_dict))
+    cache.register(CacheSource("modpack", fetch_modpack_versions_from_the_internet,
+                               encode=ModpackCatalog.to_dict, decode=ModpackCatalog.from_dict))
+    return cache
 
-    versions_cache_file = f"{cache_data_path}\\cache_forge_versions.json"
-    now = datetime.now()
-
-    # If there already exists an updated version cache file, load it and return it
-    app.update_status("working", app.translations["status_working_loading_cached_forge_versions"])
-
-    if now - app.cfg["MAIN"]["cache_date_forge"] < timedelta(days=1):
-        # Cache is updated, use cache
-        try:
-            print("Reading forge versions from file")
-            return load_json(versions_cache_file)
-        except FileNotFoundError:
-            print("ERROR: reported updated forge cache but file was not found")
-
-    print("Reading forge versions from the internet")
 
-    # Load from the internet
-    app.update_status("working", app.translations["status_working_fetching_forge_versions"])
-    forge_versions = popup_wait_for_task(app, app.translations["status_working_fetching_forge_versions"], fetch_forge_versions_from_internet)
-
-    # Save cache
-    app.update_status("working", app.translations["status_working_caching_forge_versions"])
-    save_json(forge_versions, versions_cache_file)
-
-    app.cfg["MAIN"]["cache_date_forge"] = now
-    app.cfg.write_ini()
+def get_vanilla_versions(app):
+    """
+    Returns the list of vanilla version numbers (see VersionCache.get)
 
-    return forge_versions
+    Args:
+        app: master app
+    """
+    return app.version_cache.get("vanilla", app)
 
 
-def get_modpack_versions(cache_data_path: str, app):
+def get_forge_versions(app) -> ForgeCatalog:
     """
-    Function that loads all avaliable modpacks and returns a list with their names
-    Cache will only contain the modpack names, modlist and files will be handled on launch
-    TODO: Figure out a way of having cache
+    Returns the ForgeCatalog (see VersionCache.get)
+
     Args:
-        cache_data_path: path to cache_modpack_versions.json (now ".")
         app: master app
-
     """
+    return app.version_cache.get("forge", app)
 
-    # TODO: should we have cache or just always fetch from the internet
-    versions_cache_file = f"{cache_data_path}\\cache_modpack_versions.json"
-    now = datetime.now()
 
-    app.update_status("working", app.translations["status_working_fetching_modpack_versions"])
-    modpack_versions = popup_wait_for_task(app, app.translations["status_working_fetching_modpack_versions"], fetch_modpack_versions_from_the_internet)
+def get_modpack_versions(app) -> ModpackCatalog:
+    """
+    Returns the ModpackCatalog (see VersionCache.get)
+    Cache will only contain the modpack names and info, modlist and files will be handled on launch
 
-    return modpack_versions
+    Args:
+        app: master app
+    """
+    return app.version_cache.get("modpack", app)
 
 
 if __name__ == "__main__":
-    print(fetch_modpack_versions_from_the_internet())
+    print(fetch_modpack_versions_from_the_internet({}))
@@ -0,0 +1,216 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from util.utilities import load_cache, save_cache, CorruptedFileError
+
+
+def hash_file(path: str) -> str | None:
+    """
+    Returns the sha1 of the given file, None if it can't be read
+    (Module level function so that it can be sent to other processes)
+    """
+    sha1 = hashlib.sha1()
+    try:
+        with open(path, "rb") as file:
+            while chunk := file.read(1024 * 1024):
+                sha1.update(chunk)
+    except OSError:
+        return None
+    return sha1.hexdigest()
+
+
+def get_stat(path: str) -> tuple | None:
+    """
+    (size, modification time in ns) of the given file, None if it doesn't exist
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class InstallIndex:
+    """
+    Persistent index of the files installed by portablemc (libraries, assets, game and JVM jars) in an installation
+    path. It records the size, modification time and expected sha1 of each file, and whether the content of the file
+    has been hashed and found to match with that size and modification time.
+
+    verify: Quick check of the files of a version, only the files whose stat changed since they were last verified
+            are hashed again.
+    repair: Full check, hashes every indexed file (across a thread pool, hashlib releases the GIL while hashing).
+
+    Broken files (missing or with a wrong hash) are removed, so that portablemc downloads them again on the next
+    installation (portablemc only checks their size).
+
+    Index file content:
+        files: {path : [size, modification time, expected sha1, verified]}
+        versions: {version key : [paths]}
+    """
+
+    def __init__(self, file: str):
+        self.file = file
+        self._files = {}
+        self._versions = {}
+        self._lock = Lock()
+        self.load()
+
+    def load(self):
+        try:
+            data = load_cache(self.file)
+            self._files = data["files"]
+            self._versions = data["versions"]
+        except FileNotFoundError:
+            pass
+        except (CorruptedFileError, KeyError, TypeError) as error:
+            print(f"WARNING: Installation index ignored: {error}")
+
+    def save(self):
+        try:
+            save_cache({"files": self._files, "versions": self._versions}, self.file)
+        except OSError as error:
+            print(f"WARNING: Couldn't save installation index: {error}")
+
+    def record(self, key: str, downloads: list):
+        """
+        Records the files that a version has just installed
+        Args:
+            key: version key, ex: "vanilla-1.21"
+            downloads: [(path, expected sha1)] of every file installed (or verified) by portablemc, files without
+                expected sha1 (None) can't be verified and aren't indexed
+        """
+        with self._lock:
+            paths = []
+            for path, sha1 in downloads:
+                stat = get_stat(path) if sha1 is not None else None
+                if stat is None:
+                    continue
+                paths.append(path)
+
+                record = self._files.get(path)
+                if record is not None and tuple(record[:2]) == stat and record[2] == sha1:
+                    continue # Already indexed, keep its verified flag
+                # Content hasn't been checked yet, the first verify will hash it
+                self._files[path] = [stat[0], stat[1], sha1, False]
+
+            self._versions[key] = paths
+            self.save()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._versions
+
+    def get_paths(self, key: str) -> list:
+        return self._versions.get(key, [])
+
+    def verify(self, key: str) -> list | None:
+        """
+        Quick verification of the files of the given version, only files whose stat changed since they were last
+        verified are hashed again.
+
+        Returns the list of broken files (removed), None if the version isn't indexed
+        """
+        if key not in self._versions:
+            return None
+
+        with self._lock:
+            to_hash = []
+            for path in self._versions[key]:
+                size, mtime, sha1, verified = self._files[path]
+                stat = get_stat(path)
+                if not verified or stat != (size, mtime):
+                    to_hash.append(path)
+
+            # Threads are enough here, only a few files should have changed (hashlib releases the GIL anyway)
+            with ThreadPoolExecutor() as executor:
+                hashes = list(executor.map(hash_file, to_hash))
+
+            broken = self._apply_hashes(to_hash, hashes)
+            self.save()
+
+        if to_hash:
+            print(f"DEBUG: {len(to_hash)} files of {key} rehashed, {len(broken)} broken")
+        return broken
+
+    def repair(self, workers: int | None = None) -> tuple:
+        """
+        Full verification: hashes every indexed file in a thread pool
+
+        Returns:
+            (number of files checked, {version key : [broken files (removed)]})
+        """
+        with self._lock:
+            # Forget files that no version uses anymore
+            used = set()
+            for version_paths in self._versions.values():
+                used.update(version_paths)
+            self._files = {path: record for path, record in self._files.items() if path in used}
+
+            paths = list(self._files.keys())
+            # Not a process pool: it would need freeze_support in the frozen (PyInstaller) launcher
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                hashes = list(executor.map(hash_file, paths))
+
+            broken = set(self._apply_hashes(paths, hashes))
+            self.save()
+
+        broken_versions = {}
+        for key, version_paths in self._versions.items():
+            version_broken = [path for path in version_paths if path in broken]
+            if version_broken:
+                broken_versions[key] = version_broken
+        return len(paths), broken_versions
+
+    def _apply_hashes(self, paths: list, hashes: list) -> list:
+        """
+        Updates the records of the given files according to their hash, removes the broken ones
+        Returns the list of broken files
+        """
+        broken = []
+        for path, file_hash in zip(paths, hashes):
+            record = self._files[path]
+            stat = get_stat(path)
+            if file_hash is not None and stat is not None and file_hash == record[2]:
+                self._files[path] = [stat[0], stat[1], record[2], True]
+                continue
+
+            print(f"WARNING: Broken file (will be downloaded again): {path}")
+            broken.append(path)
+            record[3] = False
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return broken
+
+
+def main():
+    """
+    Function only intended for testing and debugging purposes
+    Indexes some files, breaks one of them and checks that verify only rehashes what changed and that repair finds it
+    """
+    from tempfile import TemporaryDirectory
+    from time import sleep
+
+    with TemporaryDirectory() as directory:
+        downloads = []
+        for i in range(100):
+            path = os.path.join(directory, f"lib{i}.jar")
+            with open(path, "wb") as file:
+                file.write(os.urandom(100000))
+            downloads.append((path, hash_file(path)))
+
+        index = InstallIndex(os.path.join(directory, "index.bin"))
+        index.record("test", downloads)
+        print("First verify (everything hashed):", index.verify("test"))
+        print("Second verify (nothing hashed):", index.verify("test"))
+
+        sleep(0.01)
+        with open(downloads[0][0], "r+b") as file:
+            file.write(b"broken")
+        print("Verify after breaking a file:", index.verify("test"))
+        print("Repair:", index.repair())
+
+
+if __name__ == "__main__":
+    main()
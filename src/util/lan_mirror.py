@@ -0,0 +1,183 @@
+import socket
+import portablemc.standard
+import portablemc.forge
+from time import time
+from urllib.parse import urlsplit
+from portablemc.download import DownloadList, DownloadEntry, DownloadResultError
+from portablemc.http import http_request as _http_request, HttpError, HttpResponse
+
+"""
+    LAN mirror, client side (cfg["MAIN"]["mirror_url"], ex: http://192.168.1.10:8585). Shops with many launcher
+    installs can point all of them to a launcher that serves its downloads to the LAN (see util/mirror_server.py), so
+    that libraries, assets, Forge jars and mods are only downloaded from the internet once.
+
+    Every download is tried from the mirror first and falls back to its upstream URL if the mirror fails:
+        - Mods, modpack snapshots and git installers (util/downloader.py): the mirror is one more mirror of the file
+        - Libraries, assets, version jars and JVMs (portablemc DownloadList): MirrorDownloadList
+        - Version manifests, Forge Maven, modlists... (portablemc http_request): http_request
+    Upstream URLs are mapped to mirror URLs as <mirror>/<scheme>/<host>/<path>. GitHub's API isn't mirrored (rate
+    limit and authentication depend on who asks) and neither are git clones (use the archive backend,
+    cfg["MAIN"]["modpack_sync"]). If the mirror can't be reached, it is skipped for MIRROR_RETRY_INTERVAL seconds.
+
+    portablemc's http_request has no timeout, so before using it the mirror is probed with a short connection timeout
+    (at most once every MIRROR_RETRY_INTERVAL seconds): an unreachable mirror can't hang manifest requests.
+"""
+
+MIRROR_RETRY_INTERVAL = 60 # Seconds the mirror is skipped after it couldn't be reached
+MIRROR_CONNECT_TIMEOUT = 2 # Seconds, the mirror is in the LAN
+UNMIRRORED_HOSTS = ("api.github.com",)
+
+_mirror_url = None
+_down_until = 0.0
+_up_until = 0.0 # The mirror was reachable recently, no need to probe it
+
+
+def configure_mirror(cfg) -> None:
+    """
+    Uses the mirror of the configuration, if any. A launcher that serves as mirror uses itself, so that everything it
+    downloads is cached for the rest of the LAN
+    """
+    url = cfg["MAIN"]["mirror_url"]
+    if not url and cfg["MAIN"]["mirror_serve"]:
+        url = f"http://127.0.0.1:{cfg['MAIN']['mirror_port']}"
+    if url:
+        set_mirror(url)
+
+
+def set_mirror(url: str | None) -> None:
+    global _mirror_url, _down_until, _up_until
+    _mirror_url = url.rstrip("/") if url else None
+    _down_until = _up_until = 0.0
+    # portablemc requests manifests with its own http_request, route them through the mirror too
+    portablemc.standard.http_request = http_request
+    portablemc.forge.http_request = http_request
+    if _mirror_url is not None:
+        print(f"Downloads will be tried from the LAN mirror first: {_mirror_url}")
+
+
+def get_mirror_url(url: str) -> str | None:
+    """
+    URL of the given upstream URL in the mirror, None if it can't be downloaded from the mirror (right now)
+    """
+    if _mirror_url is None or time() < _down_until or url.startswith(_mirror_url + "/"):
+        return None
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or parts.hostname in UNMIRRORED_HOSTS:
+        return None
+    mirror_url = f"{_mirror_url}/{parts.scheme}/{parts.netloc}{parts.path or '/'}"
+    return mirror_url + f"?{parts.query}" if parts.query else mirror_url
+
+
+def is_mirror_url(url: str) -> bool:
+    return _mirror_url is not None and url.startswith(_mirror_url + "/")
+
+
+def mark_mirror_down(error) -> None:
+    """
+    The mirror couldn't be reached, downloads go straight upstream for a while
+    """
+    global _down_until, _up_until
+    if time() >= _down_until:
+        print(f"WARNING: LAN mirror unreachable ({error}), skipping it for {MIRROR_RETRY_INTERVAL}s")
+    _down_until = time() + MIRROR_RETRY_INTERVAL
+    _up_until = 0.0
+
+
+def probe_mirror() -> bool:
+    """
+    True if the mirror accepts connections (within MIRROR_CONNECT_TIMEOUT), otherwise it is marked as down
+    """
+    global _up_until
+    if time() < _up_until:
+        return True
+    parts = urlsplit(_mirror_url)
+    try:
+        socket.create_connection((parts.hostname, parts.port or (443 if parts.scheme == "https" else 80)),
+                                 timeout=MIRROR_CONNECT_TIMEOUT).close()
+    except OSError as error:
+        mark_mirror_down(error)
+        return False
+    _up_until = time() + MIRROR_RETRY_INTERVAL
+    return True
+
+
+def mirror_urls(urls: list) -> list:
+    """
+    Mirrors (util/downloader.py) of a file with the LAN mirror first
+    """
+    return [mirror_url for mirror_url in map(get_mirror_url, urls) if mirror_url is not None] + urls
+
+
+def http_request(method: str, url: str, **kwargs) -> HttpResponse:
+    """
+    portablemc.http.http_request, GET requests are tried from the mirror first
+    """
+    mirror_url = get_mirror_url(url) if method == "GET" else None
+    if mirror_url is not None and probe_mirror():
+        try:
+            return _http_request(method, mirror_url, **kwargs)
+        except HttpError as error:
+            if error.res.status == 304:
+                # Not Modified is an answer, not a failure
+                raise
+            if error.res.status == 0:
+                mark_mirror_down(error.reason)
+            else:
+                print(f"DEBUG: LAN mirror failed ({error.res.status}), requesting {url}")
+    return _http_request(method, url, **kwargs)
+
+
+def _add_with_port(download_list, entry: DownloadEntry, verify: bool) -> None:
+    """
+    DownloadList.add for URLs that may have a port (the mirror's): portablemc opens connections to the host:port of the
+    URL as host, which can't be resolved, keep only the host (the port is passed separately)
+    """
+    count = len(download_list.entries)
+    download_list.add(entry, verify=verify)
+    if len(download_list.entries) > count:
+        download_list.entries[-1].host = urlsplit(entry.url).hostname
+
+
+class MirrorDownloadList(DownloadList):
+    """
+    portablemc DownloadList that downloads every file from the mirror, the ones that fail are downloaded again from
+    their upstream URL
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._upstream = {} # {destination path: upstream DownloadEntry}
+
+    def clear(self) -> None:
+        super().clear()
+        self._upstream.clear()
+
+    def add(self, entry: DownloadEntry, *, verify: bool = False) -> None:
+        mirror_url = get_mirror_url(entry.url)
+        if mirror_url is None:
+            super().add(entry, verify=verify)
+            return
+        self._upstream[entry.dst] = entry
+        _add_with_port(super(), DownloadEntry(mirror_url, entry.dst, size=entry.size, sha1=entry.sha1,
+                                              name=entry.name, executable=entry.executable), verify)
+
+    def download(self, threads_count: int, *, partial_progress: bool = False):
+        failed = []
+        result_count = 0
+        for result_count, result in super().download(threads_count, partial_progress=partial_progress):
+            if isinstance(result, DownloadResultError) and result.entry.dst in self._upstream:
+                if result.code == DownloadResultError.CONNECTION:
+                    mark_mirror_down(result.origin)
+                failed.append(self._upstream[result.entry.dst])
+                continue
+            yield result_count, result
+
+        if not failed:
+            return
+        print(f"WARNING: {len(failed)} files couldn't be downloaded from the LAN mirror, trying upstream")
+        upstream = DownloadList()
+        for entry in failed:
+            _add_with_port(upstream, entry, False)
+        for upstream_count, result in upstream.download(min(threads_count, len(failed)),
+                                                        partial_progress=partial_progress):
+            yield result_count - len(failed) + upstream_count, result
@@ -0,0 +1,290 @@
+import hashlib
+import os
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread, get_ident
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+from util.downloader import DOWNLOAD_TIMEOUT, CHUNK_SIZE, USER_AGENT
+from util.utilities import load_json, save_json
+
+"""
+    LAN mirror, server side (cfg["MAIN"]["mirror_serve"] in the GUI, or headless: python cli.py serve). Serves the
+    files it has downloaded to the launchers of the LAN (see util/lan_mirror.py) over plain HTTP.
+
+    It is a pull-through cache: <mirror>/<scheme>/<host>/<path> is answered from the cache if the file has already
+    been downloaded, otherwise it is downloaded from <scheme>://<host>/<path> and sent to the launcher while it is
+    being saved. The launcher that serves as mirror downloads through it as well, so everything it installs is cached.
+    Only files from MIRRORED_HOSTS (and cfg["MAIN"]["mirror_hosts"]) are downloaded, the mirror isn't an open proxy.
+
+    Files are saved by the sha1 of their URL, along with their upstream validators. Libraries, assets, jars and mods
+    never change once published, but manifests, Maven metadata and modlists do: those are revalidated upstream every
+    time they are requested (a 304 if they didn't change), and served from the cache if upstream can't be reached.
+    The cache isn't evicted, it can be removed at any time.
+
+    mirror_cache/
+        <first 2 characters of sha1>/<sha1>: file
+        <first 2 characters of sha1>/<sha1>.json: {url, size, etag, last_modified, content_type}
+"""
+
+MIRROR_DIR = "mirror_cache"
+MIRRORED_HOSTS = (
+    "piston-meta.mojang.com", "piston-data.mojang.com", "launchermeta.mojang.com", "launcher.mojang.com",
+    "libraries.minecraft.net", "resources.download.minecraft.net", "repo1.maven.org",
+    "maven.minecraftforge.net", "files.minecraftforge.net", "maven.neoforged.net",
+    "github.com", "raw.githubusercontent.com", "codeload.github.com",
+    "cdn.modrinth.com", "edge.forgecdn.net", "mediafilez.forgecdn.net"
+)
+# Content that may change without its URL changing, revalidated on every request
+MUTABLE_HOSTS = ("raw.githubusercontent.com", "codeload.github.com")
+MUTABLE_EXTENSIONS = (".json", ".xml", ".sha1", ".md5")
+
+
+class MirrorServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, directory: str, port: int, extra_hosts: str = ""):
+        """
+        Args:
+            directory: Cache directory
+            port: Port to listen on (every interface)
+            extra_hosts: Upstream hosts allowed besides MIRRORED_HOSTS, comma separated, "*" allows any host
+        """
+        super().__init__(("", port), MirrorRequestHandler)
+        self.directory = directory
+        self.allowed_hosts = set(MIRRORED_HOSTS)
+        self.allowed_hosts.update(host.strip().lower() for host in extra_hosts.split(",") if host.strip())
+
+    def is_allowed(self, host: str) -> bool:
+        return "*" in self.allowed_hosts or host in self.allowed_hosts
+
+    def get_path(self, url: str) -> str:
+        sha1 = hashlib.sha1(url.encode()).hexdigest()
+        return os.path.join(self.directory, sha1[:2], sha1)
+
+    def load_metadata(self, path: str) -> dict | None:
+        """
+        Metadata of the cached file, None if it isn't cached (or the file doesn't match it)
+        """
+        try:
+            metadata = load_json(path + ".json")
+            if os.path.getsize(path) == metadata["size"]:
+                return metadata
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return None
+
+
+class MirrorRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "PyMinecraft-Mirror"
+
+    def log_message(self, format, *args):
+        pass # Every download would be logged, hits and misses are printed instead
+
+    def do_GET(self):
+        # /<scheme>/<host>/<path>
+        parts = self.path.split("/", maxsplit=3)
+        if len(parts) < 4 or parts[1] not in ("http", "https") or not parts[2]:
+            self._send_status(400)
+            return
+        scheme, netloc, path = parts[1:]
+        if not self.server.is_allowed(netloc.split(":")[0].lower()):
+            self._send_status(403)
+            return
+        url = f"{scheme}://{netloc}/{path}"
+
+        cache_path = self.server.get_path(url)
+        metadata = self.server.load_metadata(cache_path)
+        mutable = netloc in MUTABLE_HOSTS or url.split("?")[0].endswith(MUTABLE_EXTENSIONS)
+        if metadata is not None and not mutable:
+            self._send_cached(cache_path, metadata)
+            return
+
+        headers = {"User-Agent": USER_AGENT}
+        if metadata is not None and metadata["etag"]:
+            headers["If-None-Match"] = metadata["etag"]
+        if metadata is not None and metadata["last_modified"]:
+            headers["If-Modified-Since"] = metadata["last_modified"]
+        try:
+            response = urlopen(Request(url, headers=headers), timeout=DOWNLOAD_TIMEOUT)
+        except HTTPError as error:
+            if metadata is not None and (error.code == 304 or error.code >= 500):
+                self._send_cached(cache_path, metadata)
+            else:
+                self._send_status(404 if error.code in (404, 410) else 502)
+            return
+        except OSError as error:
+            if metadata is not None:
+                print(f"WARNING: Mirror couldn't revalidate {url} ({error}), serving the cached copy")
+                self._send_cached(cache_path, metadata)
+            else:
+                print(f"WARNING: Mirror couldn't download {url} ({error})")
+                self._send_status(502)
+            return
+
+        with response:
+            self._send_upstream(url, response, cache_path)
+
+    def _send_status(self, status: int) -> None:
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _send_cached(self, path: str, metadata: dict) -> None:
+        """
+        Sends a cached file (or a 304, if the launcher already has it)
+        """
+        etag = self.headers.get("If-None-Match")
+        last_modified = self.headers.get("If-Modified-Since")
+        if (etag is not None and etag == metadata["etag"]) or (
+                etag is None and last_modified is not None and last_modified == metadata["last_modified"]):
+            self.send_response(304)
+            self._send_validators(metadata)
+            self.end_headers()
+            return
+
+        try:
+            file = open(path, "rb")
+        except OSError:
+            self._send_status(404)
+            return
+        with file:
+            self.send_response(200)
+            self.send_header("Content-Length", str(metadata["size"]))
+            self.send_header("Content-Type", metadata["content_type"] or "application/octet-stream")
+            self._send_validators(metadata)
+            self.end_headers()
+            while chunk := file.read(CHUNK_SIZE):
+                self.wfile.write(chunk)
+
+    def _send_validators(self, metadata: dict) -> None:
+        if metadata["etag"]:
+            self.send_header("ETag", metadata["etag"])
+        if metadata["last_modified"]:
+            self.send_header("Last-Modified", metadata["last_modified"])
+
+    def _send_upstream(self, url: str, response, path: str) -> None:
+        """
+        Sends the upstream response to the launcher while it is saved in the cache. If the launcher disconnects, the
+        file is still downloaded and cached
+        """
+        size = response.getheader("Content-Length")
+        size = int(size) if size is not None and size.isdigit() else None
+        metadata = {"url": url, "size": size, "etag": response.getheader("ETag"),
+                    "last_modified": response.getheader("Last-Modified"),
+                    "content_type": response.getheader("Content-Type")}
+
+        self.send_response(200)
+        if size is not None:
+            self.send_header("Content-Length", str(size))
+        else:
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        if metadata["content_type"]:
+            self.send_header("Content-Type", metadata["content_type"])
+        self._send_validators(metadata)
+        self.end_headers()
+
+        # Several launchers may request the same file at the same time, each one downloads its own copy
+        tmp_path = f"{path}.{get_ident()}.tmp"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        sending = True
+        written = 0
+        try:
+            with open(tmp_path, "wb") as file:
+                while chunk := response.read(CHUNK_SIZE):
+                    file.write(chunk)
+                    written += len(chunk)
+                    if sending:
+                        try:
+                            self.wfile.write(chunk)
+                        except OSError:
+                            sending = False
+                            self.close_connection = True
+        except OSError as error:
+            print(f"WARNING: Mirror download of {url} failed ({error})")
+            self.close_connection = True
+            os.remove(tmp_path)
+            return
+
+        if size is not None and written != size:
+            print(f"WARNING: Mirror download of {url} is incomplete ({written}/{size} bytes)")
+            os.remove(tmp_path)
+            return
+        metadata["size"] = written
+        os.replace(tmp_path, path)
+        save_json(metadata, path + ".json")
+        print(f"Mirror: {url} cached ({written / 1000000:.2f}Mb)")
+
+
+def start_mirror_server(cfg, directory: str = MIRROR_DIR) -> MirrorServer | None:
+    """
+    Starts serving the mirror in the background (cfg["MAIN"]["mirror_port"]), returns None if it couldn't be started
+    """
+    try:
+        server = MirrorServer(directory, cfg["MAIN"]["mirror_port"], cfg["MAIN"]["mirror_hosts"])
+    except OSError as error:
+        print(f"ERROR: LAN mirror couldn't be started on port {cfg['MAIN']['mirror_port']}: {error}")
+        return None
+    Thread(target=server.serve_forever, daemon=True, name="LAN mirror").start()
+    print(f"Serving the LAN mirror on port {cfg['MAIN']['mirror_port']} ({os.path.abspath(directory)})")
+    return server
+
+
+def main():
+    """
+    Function only intended for testing and debugging purposes
+    Serves the mirror and a stand-in upstream locally, checks that the first request of a file caches it, that the
+    second one is served without contacting upstream and that requests fall back upstream once the mirror is down
+    """
+    from functools import partial
+    from http.server import SimpleHTTPRequestHandler
+    from tempfile import TemporaryDirectory
+    from time import sleep
+    from util.lan_mirror import set_mirror, http_request
+
+    upstream_requests = []
+
+    class UpstreamHandler(SimpleHTTPRequestHandler):
+        def do_GET(self):
+            upstream_requests.append(self.path)
+            super().do_GET()
+
+        def log_message(self, format, *args):
+            pass
+
+    with TemporaryDirectory() as directory:
+        content = os.urandom(100000)
+        with open(os.path.join(directory, "mod.jar"), "wb") as file:
+            file.write(content)
+        upstream = ThreadingHTTPServer(("127.0.0.1", 0), partial(UpstreamHandler, directory=directory))
+        Thread(target=upstream.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{upstream.server_address[1]}/mod.jar"
+
+        server = MirrorServer(os.path.join(directory, MIRROR_DIR), 0, "127.0.0.1")
+        Thread(target=server.serve_forever, daemon=True).start()
+        set_mirror(f"http://127.0.0.1:{server.server_address[1]}")
+
+        assert http_request("GET", url).data == content
+        sleep(0.1) # The file is saved in the cache once it has been sent
+        assert server.load_metadata(server.get_path(url)) is not None and len(upstream_requests) == 1
+        print("First request: downloaded from upstream and cached")
+
+        assert http_request("GET", url).data == content
+        assert len(upstream_requests) == 1
+        print("Second request: served from the cache, upstream wasn't contacted")
+
+        server.shutdown()
+        server.server_close()
+        # Forget that it was reachable, so that it is probed again
+        set_mirror(f"http://127.0.0.1:{server.server_address[1]}")
+        assert http_request("GET", url).data == content
+        assert len(upstream_requests) == 2
+        print("Mirror down: downloaded from upstream")
+
+        upstream.shutdown()
+        upstream.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import os
+from time import time
+from util.install_index import hash_file, get_stat
+from util.utilities import load_cache, save_cache, link_or_copy, CorruptedFileError
+
+"""
+    Different modpacks often ship the same mods. Every mod installed by a modpack sync is also stored in the mod cache
+    of the installation path, named after its sha1 (content-addressed), so that installing it in another modpack (or
+    again in the same one, after a rollback) is a local hard link (or a copy, if linking isn't possible) instead of a
+    download.
+
+    Mods are looked up by the sha1 of their modlist entry or, if the modlist doesn't carry one, by their URLs (the cache
+    remembers which content each URL served when it was downloaded). Hard links don't take any extra disk space while
+    the mod is installed somewhere else, but the cache keeps mods that aren't installed anymore: the least recently used
+    ones are evicted once the cache grows beyond its maximum size (cfg["MAIN"]["mod_cache_size"], MB).
+
+    URL-keyed mods are assumed to be immutable: if a jar changes upstream without its URL changing (and the modlist
+    doesn't carry its sha1 or size), the cached one keeps being installed. Modlists should give the sha1 of such mods.
+    Retrying a mod (see retry_mods) forgets what its URLs served, so that it is downloaded again.
+
+    <path>/pyminecraft_mod_cache/
+        objects/<first 2 characters of sha1>/<sha1>
+        index.bin
+"""
+
+MOD_CACHE_DIR = "pyminecraft_mod_cache"
+
+
+class ModCache:
+    """
+    Content-addressed mod cache
+    Index file content:
+        objects: {sha1 : [size, modification time, last use timestamp]}
+        urls: {URL : sha1}
+    """
+
+    def __init__(self, directory: str, max_size: int):
+        """
+        Args:
+            directory: Cache directory
+            max_size: Size in bytes the cache is evicted to
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self._objects = {}
+        self._urls = {}
+        try:
+            data = load_cache(os.path.join(directory, "index.bin"))
+            self._objects = data["objects"]
+            self._urls = data["urls"]
+        except FileNotFoundError:
+            pass
+        except (CorruptedFileError, KeyError, TypeError) as error:
+            print(f"WARNING: Mod cache index ignored: {error}")
+
+    def _get_object_path(self, sha1: str) -> str:
+        return os.path.join(self.directory, "objects", sha1[:2], sha1)
+
+    def _lookup(self, entry: dict) -> str | None:
+        """
+        sha1 of the cached mod of the given (parsed) modlist entry, None if it isn't cached
+        """
+        sha1 = entry["sha1"] or next((self._urls[url] for url in entry["urls"] if url in self._urls), None)
+        record = self._objects.get(sha1)
+        if record is None or entry["size"] not in (None, record[0]):
+            return None
+        return sha1
+
+    def forget(self, entry: dict) -> None:
+        """
+        Forgets which content the URLs of the given (parsed) modlist entry served, so that it is downloaded again
+        """
+        for url in entry["urls"]:
+            self._urls.pop(url, None)
+
+    def __contains__(self, entry: dict) -> bool:
+        return self._lookup(entry) is not None
+
+    def install(self, entry: dict, dst: str) -> str | None:
+        """
+        Installs the mod of the given (parsed) modlist entry in dst if it is cached
+        Returns its sha1, None if it isn't cached
+        """
+        sha1 = self._lookup(entry)
+        if sha1 is None:
+            return None
+        record = self._objects[sha1]
+
+        # Cached mods are hard linked to installed ones, a jar modified in place modifies its cached copy too
+        stat = get_stat(self._get_object_path(sha1))
+        if stat != tuple(record[:2]):
+            if stat is None or hash_file(self._get_object_path(sha1)) != sha1:
+                print(f"WARNING: Broken mod removed from the mod cache: {sha1}")
+                self._remove(sha1)
+                return None
+            record[:2] = stat
+
+        try:
+            link_or_copy(self._get_object_path(sha1), dst)
+        except OSError as error:
+            print(f"WARNING: Couldn't install {os.path.basename(dst)} from the mod cache: {error}")
+            return None
+        record[2] = time()
+        return sha1
+
+    def add(self, path: str, sha1: str, urls: list | None = None) -> None:
+        """
+        Stores the given mod file (already verified to have the given sha1)
+        Args:
+            path:
+            sha1:
+            urls: URLs (mirrors) the file has just been downloaded from, if any
+        """
+        object_path = self._get_object_path(sha1)
+        record = self._objects.get(sha1)
+        if record is None or get_stat(object_path) != tuple(record[:2]):
+            tmp_path = object_path + ".tmp"
+            try:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                link_or_copy(path, tmp_path)
+                os.replace(tmp_path, object_path)
+            except OSError as error:
+                print(f"WARNING: Couldn't add {os.path.basename(path)} to the mod cache: {error}")
+                return
+            record = self._objects[sha1] = [*get_stat(object_path), 0]
+
+        record[2] = time()
+        for url in urls or []:
+            self._urls[url] = sha1
+
+    def evict(self) -> None:
+        """
+        Removes the least recently used mods until the cache fits in its maximum size
+        """
+        total_size = sum(record[0] for record in self._objects.values())
+        if total_size <= self.max_size:
+            return
+
+        evicted = 0
+        for sha1, record in sorted(self._objects.items(), key=lambda item: item[1][2]):
+            if total_size <= self.max_size:
+                break
+            if self._remove(sha1):
+                total_size -= record[0]
+                evicted += 1
+
+        print(f"DEBUG: {evicted} mods evicted from the mod cache ({total_size / 1000000:.2f}Mb left)")
+
+    def _remove(self, sha1: str) -> bool:
+        """
+        Removes a mod from the cache, returns False if it couldn't be removed
+        """
+        try:
+            os.remove(self._get_object_path(sha1))
+        except FileNotFoundError:
+            pass
+        except OSError as error:
+            print(f"WARNING: Couldn't remove {sha1} from the mod cache: {error}")
+            return False
+        del self._objects[sha1]
+        self._urls = {url: url_sha1 for url, url_sha1 in self._urls.items() if url_sha1 != sha1}
+        return True
+
+    def save(self) -> None:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            save_cache({"objects": self._objects, "urls": self._urls}, os.path.join(self.directory, "index.bin"))
+        except OSError as error:
+            print(f"WARNING: Couldn't save mod cache index: {error}")
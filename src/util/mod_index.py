@@ -0,0 +1,114 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from util.install_index import hash_file, get_stat
+from util.utilities import load_cache, save_cache, CorruptedFileError
+
+"""
+    Modlist entries (mods/modlist.json in every modpack repo) can be either:
+        "mod_filename.jar": "URL"
+        "mod_filename.jar": ["URL", "mirror URL", ...]
+        "mod_filename.jar": {"url": "URL", "sha1": "...", "size": 123}
+        "mod_filename.jar": {"urls": ["URL", "mirror URL", ...], "sha1": "...", "size": 123}
+    Mirrors are tried in order until one of them works (see util/downloader.py). sha1 and size are optional. When a
+    modlist carries them, mods are compared by content instead of by file name: corrupted or replaced jars are
+    downloaded again and mods that were only renamed are reused instead of downloaded.
+
+    ModIndex keeps the sha1 of every file of a mods folder along with its size and modification time, so that only
+    the files whose stat changed since the last sync are hashed again.
+"""
+
+
+def parse_modlist(modlist: dict) -> dict:
+    """
+    Normalizes the entries of a modlist
+    Returns:
+        {mod_filename : {"urls": [URLs], "sha1": sha1 or None, "size": size or None}}
+    """
+    parsed = {}
+    for name, entry in modlist.items():
+        if not isinstance(entry, dict):
+            entry = {"urls": entry}
+        urls = entry["urls"] if "urls" in entry else entry["url"]
+        parsed[name] = {"urls": [urls] if isinstance(urls, str) else list(urls),
+                        "sha1": entry.get("sha1"), "size": entry.get("size")}
+    return parsed
+
+
+def matches(entry: dict, size: int, sha1: str | None) -> bool:
+    """
+    True if a file with the given size and sha1 is the mod of the given (parsed) modlist entry
+    """
+    if entry["size"] is not None and entry["size"] != size:
+        return False
+    return entry["sha1"] is None or entry["sha1"] == sha1
+
+
+class ModIndex:
+    """
+    Persistent index of the content of a mods folder
+    Index file content: {mod_filename : [size, modification time, sha1]}
+    """
+
+    def __init__(self, mods_dir: str, file: str):
+        self.mods_dir = mods_dir
+        self.file = file
+        self._files = {}
+        try:
+            self._files = load_cache(file)
+        except FileNotFoundError:
+            pass
+        except CorruptedFileError as error:
+            print(f"WARNING: Mod index ignored: {error}")
+
+    def scan(self) -> dict:
+        """
+        Reads the mods folder, hashing only the files that are new or whose stat changed
+        Returns:
+            {mod_filename : (size, sha1)} of every installed file
+        """
+        try:
+            names = [entry.name for entry in os.scandir(self.mods_dir) if entry.is_file()]
+        except FileNotFoundError:
+            names = []
+
+        files = {}
+        to_hash = []
+        for name in names:
+            stat = get_stat(os.path.join(self.mods_dir, name))
+            if stat is None:
+                continue
+            record = self._files.get(name)
+            if record is not None and tuple(record[:2]) == stat:
+                files[name] = record
+            else:
+                files[name] = [stat[0], stat[1], None]
+                to_hash.append(name)
+
+        with ThreadPoolExecutor() as executor:
+            hashes = executor.map(hash_file, [os.path.join(self.mods_dir, name) for name in to_hash])
+            for name, sha1 in zip(to_hash, hashes):
+                files[name][2] = sha1
+
+        if to_hash:
+            print(f"DEBUG: {len(to_hash)} mods hashed")
+        self._files = files
+        self.save()
+        return {name: (record[0], record[2]) for name, record in files.items()}
+
+    def add(self, name: str, sha1: str) -> None:
+        """
+        Records a mod that has just been installed (its hash is already known)
+        """
+        stat = get_stat(os.path.join(self.mods_dir, name))
+        if stat is not None:
+            self._files[name] = [stat[0], stat[1], sha1]
+
+    def remove(self, name: str) -> None:
+        self._files.pop(name, None)
+
+    def save(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.file), exist_ok=True)
+            save_cache(self._files, self.file)
+        except OSError as error:
+            print(f"WARNING: Couldn't save mod index: {error}")
@@ -0,0 +1,41 @@
+class ModpackCatalog:
+    """
+    All modpacks available (CalvonettaModpacks GitHub repos), along with some info about each one of them, so that it
+    can be displayed before the modpack is even cloned.
+
+    Modpack info: {"version": forge version, "subversion": forge subversion, "mod_count": int}
+    (None if the info of that modpack couldn't be fetched)
+    """
+
+    def __init__(self, modpacks: dict):
+        """
+        Args:
+            modpacks: {modpack name : modpack info}
+        """
+        self._modpacks = modpacks
+        self._names = list(modpacks.keys())
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """
+        Builds the catalog from a dictionary made by to_dict (ex: loaded from a cache file)
+        """
+        return cls(data["modpacks"])
+
+    def to_dict(self) -> dict:
+        return {"modpacks": self._modpacks}
+
+    def get_names(self) -> list:
+        return self._names
+
+    def get_info(self, name: str) -> dict | None:
+        """
+        Returns the info of the given modpack or None if it is unknown
+        """
+        return self._modpacks.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._modpacks
+
+    def __len__(self):
+        return len(self._modpacks)
@@ -1,6 +1,24 @@
 import json
+import marshal
+import struct
+import zlib
 from pathlib import Path
-from os import remove
+from os import remove, replace
+from subprocess import call
+import os
+import shutil
+
+
+class CorruptedFileError(ValueError):
+    """
+    Raised by load_cache when a cache file is corrupted (or has been written by an incompatible version)
+    """
+    pass
+
+
+# Cache files header: magic, marshal format version, payload size, payload CRC32
+CACHE_MAGIC = b"PYMC"
+CACHE_HEADER = struct.Struct(">4sBII")
 
 def load_json(filename):
     """
@@ -14,9 +32,63 @@ def save_json(content, filename):
     """
     writes contents to filename.
     filename has to be complete path to file.json
+
+    The file is written atomically (written to filename.tmp and then swapped), so that a crash mid-write never leaves
+    a half-written file behind
     """
-    with open(filename, "w", encoding="utf-8") as file:
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "w", encoding="utf-8") as file:
         json.dump(content, file, indent=4)
+    replace(tmp_filename, filename)
+
+def save_cache(content, filename):
+    """
+    Writes content to filename using a compact binary format (much faster to load than json), for cache files.
+    content can only contain python's basic types (dict, list, str, int, float, bool, None...)
+
+    Same as save_json, the file is written atomically. Its header contains a checksum, so that load_cache can
+    detect corrupted files.
+    """
+    payload = marshal.dumps(content)
+    header = CACHE_HEADER.pack(CACHE_MAGIC, marshal.version, len(payload), zlib.crc32(payload))
+
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "wb") as file:
+        file.write(header)
+        file.write(payload)
+    replace(tmp_filename, filename)
+
+def load_cache(filename):
+    """
+    returns the content saved in filename by save_cache
+    Raises FileNotFoundError if the file is not found and CorruptedFileError if its content is not valid
+    """
+    with open(filename, "rb") as file:
+        data = file.read()
+
+    try:
+        magic, version, size, checksum = CACHE_HEADER.unpack_from(data)
+    except struct.error:
+        raise CorruptedFileError(f"{filename}: Missing header")
+
+    payload = memoryview(data)[CACHE_HEADER.size:]
+    if magic != CACHE_MAGIC or version != marshal.version:
+        raise CorruptedFileError(f"{filename}: Unknown format")
+    if len(payload) != size or zlib.crc32(payload) != checksum:
+        raise CorruptedFileError(f"{filename}: Checksum mismatch")
+    return marshal.loads(payload)
+
+def link_or_copy(src, dst):
+    """
+    Hard links src to dst (no extra disk space, instant), copies it if that's not possible
+    Parent directories of dst are created if needed
+    """
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        # Different drive, file system without hard links...
+        shutil.copy2(src, dst)
 
 def get_default_path():
     user_path = str(Path.home())
@@ -39,3 +111,28 @@ def check_if_path_is_valid(path):
         return True
     except (PermissionError, FileNotFoundError):
         return False
+
+def is_git_installed():
+    """
+    Return true if git is installed and false otherwise
+    """
+
+    #return False # DEBUG
+
+    # Check if portable git installation present
+    try:
+        portable_git_path = os.getcwd() + "/portable-git"
+        call([f"{portable_git_path}/cmd/git", "--version"]) # If this works, portable git installed
+        os.environ['GIT_PYTHON_GIT_EXECUTABLE'] = fr'{portable_git_path}\cmd\git.exe' # Tell GitPython to use that git
+        return True
+    except FileNotFoundError:
+        pass
+
+    # Check if regular git installation present
+    try:
+        call(["git", "--version"])
+        return True
+    except FileNotFoundError:
+        pass
+
+    return False
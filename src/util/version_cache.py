@@ -0,0 +1,416 @@
+from concurrent.futures import ThreadPoolExecutor, Future
+from datetime import datetime, timedelta
+from queue import Queue
+from threading import RLock
+from portablemc.http import HttpError, HttpResponse
+from util.lan_mirror import http_request
+from util.utilities import load_cache, save_cache, CorruptedFileError
+
+
+class NotModified(Exception):
+    """
+    Raised by CacheSource fetch functions when the server reports that the cached version list is still up-to-date
+    (HTTP 304 Not Modified)
+    """
+    pass
+
+
+def conditional_request(url: str, validators: dict, accept: str) -> tuple[HttpResponse, dict]:
+    """
+    HTTP GET request that is only answered with the full content if it changed since the validators were received.
+
+    Args:
+        url: URL to request
+        validators: {"etag": str | None, "last_modified": str | None} received the last time the URL was requested
+        accept: Accept header (expected content type)
+
+    Returns:
+        (response, new validators)
+
+    Raises:
+        NotModified: The content didn't change (the cached copy can be used)
+        HttpError: Any other error (including network errors)
+    """
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+
+    try:
+        res = http_request("GET", url, headers=headers, accept=accept)
+    except HttpError as error:
+        if error.res.status == 304:
+            raise NotModified(url)
+        raise
+
+    # Header names are case-insensitive
+    res_headers = {name.lower(): value for name, value in res.headers.items()}
+    return res, {"etag": res_headers.get("etag"), "last_modified": res_headers.get("last-modified")}
+
+
+class CacheSource:
+    """
+    A version list that can be cached by VersionCache (vanilla versions, forge versions, modpacks...)
+
+    Each source is identified by its name, which is also used to find everything else related to it:
+        - cache_{name}_versions.bin: cache file
+        - cache_date_{name} and cache_ttl_{name}: config.ini fields (see Configuration.SCHEMA)
+        - status_working_*_{name}_versions: status bar translations
+    """
+
+    def __init__(self, name: str, fetch, encode=None, decode=None):
+        """
+        Args:
+            name: Source name, ex: "vanilla"
+            fetch: Function that fetches the version list from the internet. It receives the validators of the
+                cached copy (see conditional_request) and returns (version list, new validators). If the cached copy
+                is still up-to-date, it must raise NotModified.
+            encode: Function that turns the version list into basic types that can be saved with save_cache (if it
+                isn't made of them already)
+            decode: Inverse of encode, turns the data read from the cache file back into the version list
+        """
+        self.name = name
+        self.fetch = fetch
+        self.encode = encode if encode is not None else lambda versions: versions
+        self.decode = decode if decode is not None else lambda data: data
+
+
+class VersionCache:
+    """
+    Generic cache for every version list the launcher displays. Sources are registered once and then accessed by
+    name, so all of them share the same cache logic.
+
+    Lookups go through 3 layers:
+        1. Memory: Version lists already loaded during this session
+        2. Disk: cache_{name}_versions.bin files, {"validators": dict, "versions": version list} (see save_cache).
+           Corrupted files are treated as if there was no cache at all, so the list is fetched again
+        3. Internet: The source's fetch function
+
+    Cache files also keep the HTTP validators (ETag, Last-Modified) of the cached list, so refreshing a list that
+    didn't change only costs a 304 response: its lifetime is extended without downloading or rewriting anything.
+
+    A cached list is considered to be up-to-date for cache_ttl_{name} hours (config.ini) after cache_date_{name}.
+    Outdated lists are still returned right away (stale-while-revalidate), while a fresh copy is fetched in the
+    background. Once it has been cached, the source name is put in the updates queue so that the GUI can refresh
+    itself (Tkinter widgets can only be touched from the main thread, so the GUI has to poll the queue).
+
+    Only the very first fetch of a source (nothing cached at all) blocks the app.
+
+    Usage:
+        cache = VersionCache(cfg)
+        cache.register(CacheSource("vanilla", fetch_vanilla_versions_from_internet))
+        versions = cache.get("vanilla", app)
+    """
+
+    def __init__(self, cfg, path="."):
+        """
+        Args:
+            cfg: Configuration object (config.ini), where cache dates and TTLs are stored
+            path: Directory where the cache files are saved
+        """
+        self.cfg = cfg
+        self.path = path
+        self.sources = {}  # {name : CacheSource}
+        self._memory = {}  # {name : version list}, in-memory layer
+        self._validators = {}  # {name : validators dict} of the lists in memory
+        self._stats = {}  # {name : {"memory_hits": int, "disk_hits": int, "stale_hits": int, "misses": int}}
+        self._lock = RLock()
+
+        self.updates = Queue()  # Names of the sources that have been refreshed in the background
+        self._refreshing = {}  # {name : Future} background refreshes in progress
+        self._executor = ThreadPoolExecutor(thread_name_prefix="version_cache")
+
+    def register(self, source: CacheSource):
+        self.sources[source.name] = source
+        self._stats[source.name] = {"memory_hits": 0, "disk_hits": 0, "stale_hits": 0, "misses": 0}
+
+    def get_file(self, name: str) -> str:
+        return f"{self.path}/cache_{name}_versions.bin"
+
+    def get_ttl(self, name: str) -> timedelta:
+        return timedelta(hours=self.cfg["MAIN"][f"cache_ttl_{name}"])
+
+    def is_fresh(self, name: str) -> bool:
+        """
+        Returns True if the cached list of the given source has not yet expired
+        """
+        return datetime.now() - self.cfg["MAIN"][f"cache_date_{name}"] < self.get_ttl(name)
+
+    def get(self, name: str, app):
+        """
+        Returns the version list of the given source, from the fastest layer that has a copy of it.
+        If the cached copy has expired, it is still returned and a background refresh is started (see refresh).
+        If nothing is cached, the list is fetched from the internet (blocking the app, App displays a wait popup) and cached.
+
+        Args:
+            name: Source name
+            app: master app (ProgressReporter)
+        """
+
+        stats = self._stats[name]
+
+        with self._lock:
+            fresh = self.is_fresh(name)
+            versions = self._memory.get(name)
+
+            # Memory layer
+            if versions is not None and fresh:
+                stats["memory_hits"] += 1
+                return versions
+
+            # Disk layer
+            if versions is None:
+                app.update_status("working", app.translations[f"status_working_loading_cached_{name}_versions"])
+                versions = self._load(name)
+
+            if versions is not None:
+                if fresh:
+                    stats["disk_hits"] += 1
+                else:
+                    # Outdated, use it anyway while we fetch the new one
+                    stats["stale_hits"] += 1
+                    self.refresh(name)
+                return versions
+
+            # Internet (the first fetch might already be in progress if the cache is being prefetched)
+            stats["misses"] += 1
+            future = self.refresh(name)
+
+        # The lock must be released while we wait, the refresh task needs it to store the result
+        print(f"Reading {name} versions from the internet")
+        message = app.translations[f"status_working_fetching_{name}_versions"]
+        app.update_status("working", message)
+        return app.wait_for_task(message, future.result)
+
+    def peek(self, name: str):
+        """
+        Returns the in-memory copy of the given source, or None if it hasn't been loaded yet.
+        Never touches the disk nor the internet (nor waits for the lock), even if the copy is outdated: meant for
+        frequent lookups on a list that has already been loaded with get (which handles its refresh).
+        """
+        versions = self._memory.get(name)
+        if versions is not None:
+            self._stats[name]["memory_hits"] += 1
+        return versions
+
+    def _load(self, name: str):
+        """
+        Reads the cache file of the given source into the memory layer
+        Returns the version list or None if there is no (valid) cache file
+        """
+        print(f"Reading {name} versions from file")
+        try:
+            cache = load_cache(self.get_file(name))
+            versions, validators = self.sources[name].decode(cache["versions"]), cache["validators"]
+            self._memory[name] = versions
+            self._validators[name] = validators
+            return versions
+        except FileNotFoundError:
+            print(f"WARNING: {name} cache file was not found")
+        except CorruptedFileError as error:
+            print(f"ERROR: {name} cache file is corrupted ({error})")
+        except (KeyError, TypeError):
+            print(f"WARNING: {name} cache file has an outdated format")
+        return None
+
+    def refresh(self, name: str) -> Future:
+        """
+        Fetches the given source from the internet in the background and caches it. Once done, the source name is put
+        in self.updates. If that source is already being refreshed, no other refresh is started.
+
+        Returns:
+            Future of the refresh, its result is the new version list (raises the fetch's exception if it failed)
+        """
+        with self._lock:
+            future = self._refreshing.get(name)
+            if future is None or future.done():
+                print(f"Refreshing {name} versions in the background")
+                future = self._executor.submit(self._refresh, name)
+                self._refreshing[name] = future
+            return future
+
+    def _refresh(self, name: str):
+        """
+        Background refresh task (see refresh). Must not touch the GUI, since it isn't run on the main thread.
+        """
+        with self._lock:
+            cached_versions = self._memory.get(name)
+            if cached_versions is None:
+                # On startup, refreshes start before the cache files are warmed up. Load it now, so that its validators
+                # are sent and the source can be revalidated (304) instead of downloaded again
+                cached_versions = self._load(name)
+            # Without a cached copy, a 304 response would be useless
+            cached_validators = self._validators.get(name, {}) if cached_versions is not None else {}
+
+        try:
+            versions, validators = self.sources[name].fetch(cached_validators)
+        except NotModified:
+            print(f"{name} versions have not changed, extending their cache lifetime")
+            self.touch(name)
+            return cached_versions
+        except Exception as error:
+            # No internet, server down... Keep using the cached list (if any), we'll try again later
+            print(f"WARNING: Background refresh of {name} versions failed: {error}")
+            raise
+
+        self.store(name, versions, validators)
+        self.updates.put(name)
+        return versions
+
+    def prefetch(self):
+        """
+        Warms up every source in the background, so that switching between version types is instant:
+            - Outdated (or never fetched) sources start refreshing right away, all of them at the same time
+            - Cache files are loaded into memory
+
+        Meant to be called once, on startup. Never blocks.
+        """
+        for name in self.sources:
+            if not self.is_fresh(name):
+                self.refresh(name)
+            self._executor.submit(self._warm_up, name)
+
+    def _warm_up(self, name: str):
+        """
+        Background prefetch task (see prefetch), loads the cache file of the given source into memory
+        """
+        with self._lock:
+            if name in self._memory:
+                # Already loaded (or refreshed)
+                return
+            versions = self._load(name)
+            if versions is None and self.is_fresh(name):
+                # Reported updated cache, but the file is missing or corrupted
+                self.refresh(name)
+
+    def store(self, name: str, versions, validators: dict):
+        """
+        Saves the given version list (and its validators) in both the memory and disk layers and marks it as up-to-date
+        """
+        # The file is written without holding the lock, so that the GUI never waits for it (writes are atomic)
+        save_cache({"validators": validators, "versions": self.sources[name].encode(versions)}, self.get_file(name))
+        with self._lock:
+            self._memory[name] = versions
+            self._validators[name] = validators
+            self.touch(name)
+
+    def touch(self, name: str):
+        """
+        Marks the cached list of the given source as up-to-date, without touching the list itself
+        """
+        with self._lock:
+            self.cfg["MAIN"][f"cache_date_{name}"] = datetime.now()
+
+    def invalidate(self, name: str | None = None):
+        """
+        Drops the in-memory copy of the given source (all of them if None), so that the next access re-reads the
+        cache file
+        """
+        with self._lock:
+            if name is None:
+                self._memory.clear()
+                self._validators.clear()
+            else:
+                self._memory.pop(name, None)
+                self._validators.pop(name, None)
+
+    def expire(self, name: str | None = None):
+        """
+        Marks the given source (all of them if None) as outdated, so that the next access fetches it from the internet
+        """
+        with self._lock:
+            names = self.sources.keys() if name is None else [name]
+            for source_name in names:
+                self.invalidate(source_name)
+                # Not datetime.min, config.ini dates must keep their microseconds to be read back
+                self.cfg["MAIN"][f"cache_date_{source_name}"] = (datetime.now() - self.get_ttl(source_name)
+                                                                  - timedelta(hours=1))
+
+    def get_stats(self) -> dict:
+        """
+        Returns a copy of the hit / miss counters of each source
+        """
+        return {name: dict(stats) for name, stats in self._stats.items()}
+
+
+def main():
+    """
+    Function only intended for testing and debugging purposes
+    Serves a version list from a local stand-in HTTP server and checks that it is only downloaded once: once expired,
+    VersionCache revalidates it (304) and only moves its cache date forward, without rewriting its cache file
+    """
+    import os
+    from collections import defaultdict
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    from tempfile import TemporaryDirectory
+    from threading import Thread
+    from time import sleep
+    from app_utils.config_manager import Configuration
+    from app_utils.progress_reporter import TextProgressReporter
+
+    class StandInHandler(BaseHTTPRequestHandler):
+        ETAG = '"versions-v1"'
+        BODY = b'["1.20.1", "1.19.4", "1.12.2"]'
+        statuses = [] # Status of every response sent
+
+        def do_GET(self):
+            if self.headers.get("If-None-Match") == self.ETAG:
+                self.statuses.append(304)
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.statuses.append(200)
+            self.send_response(200)
+            self.send_header("ETag", self.ETAG)
+            self.send_header("Content-Length", str(len(self.BODY)))
+            self.end_headers()
+            self.wfile.write(self.BODY)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/versions.json"
+
+    res, validators = conditional_request(url, {}, "application/json")
+    print(f"First request: {res.status} {res.json()} {validators}")
+    try:
+        conditional_request(url, validators, "application/json")
+        print("ERROR: Second request downloaded the list again")
+    except NotModified:
+        print("Second request: 304 Not Modified")
+
+    def fetch(cached_validators):
+        response, new_validators = conditional_request(url, cached_validators, "application/json")
+        return response.json(), new_validators
+
+    with TemporaryDirectory() as directory:
+        cfg = Configuration(path=os.path.join(directory, "config.ini"))
+        cache = VersionCache(cfg, directory)
+        cache.register(CacheSource("vanilla", fetch))
+        app = TextProgressReporter(cfg, defaultdict(lambda: "Loading versions"), cache)
+        StandInHandler.statuses.clear()
+
+        versions = cache.get("vanilla", app)
+        assert versions == ["1.20.1", "1.19.4", "1.12.2"] and StandInHandler.statuses == [200]
+        mtime = os.stat(cache.get_file("vanilla")).st_mtime_ns
+
+        cache.expire("vanilla")
+        expired_date = cfg["MAIN"]["cache_date_vanilla"]
+        sleep(0.01)
+        # The expired list is returned right away, and revalidated in the background
+        assert cache.get("vanilla", app) == versions
+        assert cache.refresh("vanilla").result() == versions
+        assert StandInHandler.statuses == [200, 304]
+        assert os.stat(cache.get_file("vanilla")).st_mtime_ns == mtime
+        assert cfg["MAIN"]["cache_date_vanilla"] > expired_date and cache.is_fresh("vanilla")
+        print("Expired list revalidated: cache date moved forward, cache file untouched")
+        cfg.flush()
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()